@@ -0,0 +1,448 @@
+import os
+import re
+import sys
+import csv
+import html
+import time
+import sqlite3
+import smtplib
+import hashlib
+import datetime
+from string import Template
+from functools import lru_cache
+from email.message import EmailMessage
+
+# Permite importar las herramientas compartidas de la carpeta 'Cambios de Capas'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from parser_kml import KML_NS, iterparse, ErroresParseo
+
+# Carpeta donde está este script (las rutas se resuelven desde aquí y no desde el cwd)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PLANTILLAS_DIR = os.path.join(BASE_DIR, 'plantillas')
+
+# Expresión regular para normalizar los nombres de los pozos de monitoreo (ej. "P - 1", "p-1" -> "P - 1")
+name_number_regex = re.compile(r'P\s*-\s*(\d+)', re.IGNORECASE)
+
+# Escenarios que se notifican. La clave es el identificador que usan los destinatarios para suscribirse.
+ESCENARIOS = {
+    'pendientes': {
+        'titulo': 'Pozos programados sin medición exitosa',
+        'descripcion': 'Pozos que figuran en la capa "Pozos Medidos" pero todavía no están en "Pozos Medidos Con Exito".',
+    },
+    'medidos': {
+        'titulo': 'Pozos medidos con éxito',
+        'descripcion': 'Pozos cargados en la capa "Pozos Medidos Con Exito".',
+    },
+    'inconsistencias': {
+        'titulo': 'Pozos con carga inconsistente',
+        'descripcion': 'Pozos que siguen en "Pozos Medidos" aunque ya están en "Pozos Medidos Con Exito", '
+                       'o que aparecen repetidos dentro de una misma capa. Revisar la carga.',
+    },
+}
+
+
+def normalizar_nombre(nombre):
+    """
+    Devuelve la clave con la que se cruzan los pozos entre capas.
+    Los nombres del tipo 'P - N' se normalizan a 'P - N' sin importar espacios o mayúsculas;
+    cualquier otro nombre se compara tal cual (sin espacios repetidos).
+    """
+    nombre = ' '.join(nombre.split())
+    match = name_number_regex.fullmatch(nombre)
+    if match:
+        return f"P - {int(match.group(1))}"
+    return nombre
+
+
+def leer_pozos(kml_path):
+    """
+    Lee los Placemarks de un KML en streaming (iterparse) y devuelve un diccionario
+    clave normalizada -> datos del pozo. El diccionario permite cruzar capas
+    con búsquedas por hash en lugar de recorrer listas.
+
+    Args:
+        kml_path (str): Ruta al archivo KML.
+
+    Returns:
+        tuple: ({clave: {'nombre', 'longitud', 'latitud', 'detalle'}}, conjunto de claves repetidas)
+    """
+    pozos = {}
+    repetidos = set()
+    for _, elem in iterparse(kml_path):
+        if elem.tag != KML_NS + 'Placemark':
+            continue
+
+        nombre = (elem.findtext(KML_NS + 'name') or '').strip()
+        if not nombre:
+            nombre = elem.attrib.get('id', 'Sin Nombre')
+
+        longitud = latitud = ''
+        coordenadas = elem.findtext('.//' + KML_NS + 'coordinates')
+        if coordenadas:
+            partes = coordenadas.split()[0].split(',')
+            if len(partes) >= 2:
+                longitud, latitud = partes[0], partes[1]
+
+        # Para el detalle nos alcanza con la primera línea de la descripción (la ubicación)
+        descripcion = (elem.findtext(KML_NS + 'description') or '').strip()
+        detalle = descripcion.splitlines()[0] if descripcion else ''
+
+        clave = normalizar_nombre(nombre)
+        if clave in pozos:
+            repetidos.add(clave)
+        pozos[clave] = {
+            'nombre': nombre,
+            'longitud': longitud,
+            'latitud': latitud,
+            'detalle': detalle,
+        }
+        # Liberamos el Placemark ya procesado para que la memoria no crezca con la capa
+        elem.clear()
+
+    return pozos, repetidos
+
+
+def clave_orden_pozo(clave):
+    """Ordena 'P - 2' antes que 'P - 10'; los nombres sin número van al final alfabéticamente."""
+    match = name_number_regex.fullmatch(clave)
+    if match:
+        return (0, int(match.group(1)), '')
+    return (1, 0, clave)
+
+
+def calcular_escenarios(programados, exitosos, repetidos=frozenset()):
+    """
+    Cruza las dos capas usando las claves de los diccionarios como conjuntos.
+    Cuando un pozo se mide con éxito se pasa de 'Pozos Medidos' a 'Pozos Medidos Con Exito',
+    por lo que un pozo presente en ambas capas indica una carga incompleta.
+
+    Args:
+        programados (dict): Pozos de 'Pozos Medidos/doc.kml'.
+        exitosos (dict): Pozos de 'Pozos Medidos Con Exito/doc.kml'.
+        repetidos (set): Claves repetidas dentro de alguna de las capas.
+
+    Returns:
+        dict: {escenario: lista de pozos ordenada por número}
+    """
+    claves_programadas = programados.keys()
+    claves_exitosas = exitosos.keys()
+    todos = {**programados, **exitosos}
+
+    conjuntos = {
+        'pendientes': (claves_programadas - claves_exitosas, programados),
+        'medidos': (set(claves_exitosas), exitosos),
+        'inconsistencias': ((claves_programadas & claves_exitosas) | set(repetidos), todos),
+    }
+
+    escenarios = {}
+    for escenario, (claves, origen) in conjuntos.items():
+        escenarios[escenario] = [origen[clave] for clave in sorted(claves, key=clave_orden_pozo)]
+    return escenarios
+
+
+@lru_cache(maxsize=None)
+def cargar_plantilla(nombre_archivo):
+    """Lee y compila una plantilla HTML una sola vez por ejecución."""
+    with open(os.path.join(PLANTILLAS_DIR, nombre_archivo), encoding='utf-8') as f:
+        return Template(f.read())
+
+
+def renderizar_seccion(escenario, pozos):
+    """Genera el bloque HTML de un escenario. Es el mismo para todos los destinatarios."""
+    filas = ''.join(
+        f"<tr><td>{html.escape(pozo['nombre'])}</td>"
+        f"<td>{html.escape(pozo['longitud'])}</td>"
+        f"<td>{html.escape(pozo['latitud'])}</td>"
+        f"<td>{html.escape(pozo['detalle'])}</td></tr>\n"
+        for pozo in pozos
+    )
+    return cargar_plantilla('seccion.html').substitute(
+        titulo=html.escape(ESCENARIOS[escenario]['titulo']),
+        cantidad=len(pozos),
+        descripcion=html.escape(ESCENARIOS[escenario]['descripcion']),
+        filas=filas,
+    )
+
+
+def cargar_destinatarios(csv_path):
+    """
+    Lee los destinatarios desde un CSV con columnas 'email', 'nombre' y 'escenarios'
+    (escenarios separados por ';'). Si la columna 'escenarios' está vacía se suscribe a todos.
+    """
+    destinatarios = []
+    with open(csv_path, encoding='utf-8', newline='') as f:
+        for fila in csv.DictReader(f):
+            email = (fila.get('email') or '').strip()
+            if not email:
+                continue
+            escenarios = [e.strip() for e in (fila.get('escenarios') or '').split(';') if e.strip()]
+            destinatarios.append({
+                'email': email,
+                'nombre': (fila.get('nombre') or '').strip() or email,
+                'escenarios': escenarios or list(ESCENARIOS),
+            })
+    return destinatarios
+
+
+def generar_digests(escenarios, destinatarios, fecha):
+    """
+    Arma un digest HTML por destinatario. Cada sección se renderiza una sola vez y se reutiliza,
+    de modo que el costo por destinatario es solo armar el envoltorio.
+
+    Returns:
+        list: tuplas (email, asunto, html, huella)
+    """
+    secciones_cache = {}
+    digests = []
+    asunto = f"Monitoreo Aguas Subterráneas - Resumen {fecha}"
+
+    for destinatario in destinatarios:
+        suscripciones = [e for e in destinatario['escenarios'] if e in ESCENARIOS]
+        # No mandamos correos vacíos: solo los escenarios con pozos
+        suscripciones = [e for e in suscripciones if escenarios.get(e)]
+        if not suscripciones:
+            continue
+
+        partes = []
+        for escenario in suscripciones:
+            if escenario not in secciones_cache:
+                secciones_cache[escenario] = renderizar_seccion(escenario, escenarios[escenario])
+            partes.append(secciones_cache[escenario])
+        secciones = ''.join(partes)
+
+        cuerpo = cargar_plantilla('digest.html').substitute(
+            asunto=html.escape(asunto),
+            nombre=html.escape(destinatario['nombre']),
+            fecha=fecha,
+            secciones=secciones,
+        )
+        # La huella evita encolar dos veces el mismo resumen si el script se vuelve a ejecutar el mismo día
+        huella = hashlib.sha256(f"{destinatario['email']}\0{fecha}\0{secciones}".encode('utf-8')).hexdigest()
+        digests.append((destinatario['email'], asunto, cuerpo, huella))
+
+    return digests
+
+
+def abrir_bandeja(bandeja_path):
+    """Abre (o crea) la bandeja de salida persistente en SQLite."""
+    con = sqlite3.connect(bandeja_path)
+    con.execute('PRAGMA journal_mode=WAL')
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS bandeja (
+            id INTEGER PRIMARY KEY,
+            destinatario TEXT NOT NULL,
+            asunto TEXT NOT NULL,
+            html TEXT NOT NULL,
+            huella TEXT NOT NULL UNIQUE,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            intentos INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            creado TEXT NOT NULL,
+            enviado TEXT
+        )
+    """)
+    con.execute('CREATE INDEX IF NOT EXISTS idx_bandeja_estado ON bandeja (estado, id)')
+    return con
+
+
+def encolar(con, digests):
+    """Guarda los digests en la bandeja en una sola transacción. Devuelve cuántos eran nuevos."""
+    ahora = datetime.datetime.now().isoformat(timespec='seconds')
+    antes = con.total_changes
+    with con:
+        con.executemany(
+            'INSERT OR IGNORE INTO bandeja (destinatario, asunto, html, huella, creado) VALUES (?, ?, ?, ?, ?)',
+            [(email, asunto, cuerpo, huella, ahora) for email, asunto, cuerpo, huella in digests],
+        )
+    return con.total_changes - antes
+
+
+def conectar_smtp(servidor, puerto, usuario=None, clave=None, usar_tls=False):
+    smtp = smtplib.SMTP(servidor, puerto, timeout=30)
+    if usar_tls:
+        smtp.starttls()
+    if usuario:
+        smtp.login(usuario, clave or '')
+    return smtp
+
+
+def enviar_pendientes(con, remitente, servidor, puerto, usuario=None, clave=None, usar_tls=False,
+                      tamano_lote=100, mensajes_por_segundo=5.0, max_intentos=3):
+    """
+    Envía los correos pendientes de la bandeja por lotes reutilizando una única conexión SMTP.
+    El estado de cada lote se guarda en la bandeja al terminarlo, así que si el proceso se corta
+    solo se reintenta lo que no llegó a confirmarse.
+
+    Args:
+        con (sqlite3.Connection): Bandeja abierta con abrir_bandeja().
+        remitente (str): Dirección 'From'.
+        servidor (str), puerto (int): Servidor SMTP (puede ser un servidor local de prueba).
+        tamano_lote (int): Cantidad de correos que se leen y confirman por vez.
+        mensajes_por_segundo (float): Límite de envío; 0 desactiva el límite.
+        max_intentos (int): Intentos antes de dejar un correo como 'fallido'.
+
+    Returns:
+        tuple: (enviados, fallidos)
+    """
+    intervalo = 1.0 / mensajes_por_segundo if mensajes_por_segundo else 0.0
+    smtp = None
+    enviados = fallidos = 0
+    proximo_envio = time.monotonic()
+    # Cada corrida recorre la bandeja una sola vez: un correo rechazado se reintenta en la próxima corrida
+    ultimo_id = 0
+
+    try:
+        while True:
+            lote = con.execute(
+                "SELECT id, destinatario, asunto, html, intentos FROM bandeja "
+                "WHERE estado = 'pendiente' AND id > ? ORDER BY id LIMIT ?",
+                (ultimo_id, tamano_lote),
+            ).fetchall()
+            if not lote:
+                break
+            ultimo_id = lote[-1][0]
+
+            if smtp is None:
+                smtp = conectar_smtp(servidor, puerto, usuario, clave, usar_tls)
+
+            ahora = datetime.datetime.now().isoformat(timespec='seconds')
+            resultados = []
+            for id_correo, destinatario, asunto, cuerpo, intentos in lote:
+                # Limitador de ritmo: esperamos hasta el próximo turno disponible
+                espera = proximo_envio - time.monotonic()
+                if espera > 0:
+                    time.sleep(espera)
+                proximo_envio = max(proximo_envio, time.monotonic()) + intervalo
+
+                mensaje = EmailMessage()
+                mensaje['From'] = remitente
+                mensaje['To'] = destinatario
+                mensaje['Subject'] = asunto
+                mensaje.set_content('Este resumen requiere un cliente de correo con soporte HTML.')
+                mensaje.add_alternative(cuerpo, subtype='html')
+
+                try:
+                    try:
+                        smtp.send_message(mensaje)
+                    except smtplib.SMTPServerDisconnected:
+                        # El servidor cerró la conexión (timeout, límite de mensajes): reconectamos una vez
+                        smtp = conectar_smtp(servidor, puerto, usuario, clave, usar_tls)
+                        smtp.send_message(mensaje)
+                    resultados.append(('enviado', intentos + 1, None, ahora, id_correo))
+                    enviados += 1
+                except (smtplib.SMTPException, OSError) as e:
+                    if isinstance(e, smtplib.SMTPRecipientsRefused) and e.recipients and all(
+                        codigo >= 500 for codigo, _ in e.recipients.values()
+                    ):
+                        # Dirección rechazada de forma permanente (5xx): no tiene sentido reintentar.
+                        # Un rechazo temporal (450/451, ej. greylisting) sigue el camino de los reintentos.
+                        estado = 'fallido'
+                    else:
+                        estado = 'fallido' if intentos + 1 >= max_intentos else 'pendiente'
+                    resultados.append((estado, intentos + 1, str(e), None, id_correo))
+                    if estado == 'fallido':
+                        fallidos += 1
+                    # SMTPException hereda de OSError: solo cortamos si falló la conexión (la reconexión
+                    # tampoco anduvo). Un correo rechazado (ej. 554) queda registrado y seguimos con el resto.
+                    if isinstance(e, smtplib.SMTPServerDisconnected) or not isinstance(e, smtplib.SMTPException):
+                        with con:
+                            con.executemany(
+                                'UPDATE bandeja SET estado = ?, intentos = ?, error = ?, enviado = ? WHERE id = ?',
+                                resultados,
+                            )
+                        smtp = None
+                        raise
+
+            with con:
+                con.executemany(
+                    'UPDATE bandeja SET estado = ?, intentos = ?, error = ?, enviado = ? WHERE id = ?',
+                    resultados,
+                )
+            print(f"Lote confirmado: {len(resultados)} correos procesados ({enviados} enviados en total).")
+    finally:
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except smtplib.SMTPException:
+                pass
+
+    return enviados, fallidos
+
+
+def notificar(programados_kml_path, exitosos_kml_path, destinatarios, bandeja_path, smtp_config):
+    """
+    Ejecuta el circuito completo: lee las capas, calcula los escenarios, genera los digests,
+    los encola en la bandeja de salida y envía todo lo pendiente.
+    """
+    try:
+        programados, repetidos_programados = leer_pozos(programados_kml_path)
+        exitosos, repetidos_exitosos = leer_pozos(exitosos_kml_path)
+        print(f"Pozos programados: {len(programados)} - Pozos medidos con éxito: {len(exitosos)}")
+
+        escenarios = calcular_escenarios(programados, exitosos, repetidos_programados | repetidos_exitosos)
+        for escenario, pozos in escenarios.items():
+            print(f"  {ESCENARIOS[escenario]['titulo']}: {len(pozos)}")
+
+        fecha = datetime.date.today().isoformat()
+        digests = generar_digests(escenarios, destinatarios, fecha)
+
+        con = abrir_bandeja(bandeja_path)
+        try:
+            nuevos = encolar(con, digests)
+            print(f"Se encolaron {nuevos} correos nuevos ({len(digests) - nuevos} ya estaban en la bandeja).")
+            enviados, fallidos = enviar_pendientes(con, **smtp_config)
+        finally:
+            con.close()
+
+        print(f"\n¡Éxito! Correos enviados: {enviados} - Fallidos: {fallidos}")
+
+    except FileNotFoundError as e:
+        print(f"Error: El archivo '{e.filename}' no fue encontrado.")
+    except ErroresParseo as e:
+        print(f"Error al parsear el archivo KML: {e}. Asegúrate de que es un XML válido.")
+    except (smtplib.SMTPException, OSError) as e:
+        print(f"Error de conexión con el servidor de correo: {e}. Los correos quedan en la bandeja para el próximo envío.")
+    except Exception as e:
+        print(f"Ocurrió un error inesperado: {e}")
+
+
+# --- Configuración ---
+# Capas a cruzar (rutas relativas a la carpeta de este script)
+programados_kml_file = os.path.join(BASE_DIR, '..', 'Pozos Medidos', 'doc.kml')
+exitosos_kml_file = os.path.join(BASE_DIR, '..', 'Pozos Medidos Con Exito', 'doc.kml')
+
+# Bandeja de salida persistente: los correos no enviados se reintentan en la próxima ejecución
+bandeja_file = os.path.join(BASE_DIR, 'bandeja_salida.db')
+
+# Destinatarios: si existe 'destinatarios.csv' (columnas email,nombre,escenarios) se usa ese archivo
+destinatarios_csv_file = os.path.join(BASE_DIR, 'destinatarios.csv')
+destinatarios_por_defecto = [
+    {'email': 'aguas.subterraneas@irrigacion.gov.ar', 'nombre': 'Aguas Subterráneas', 'escenarios': list(ESCENARIOS)},
+]
+
+# Servidor SMTP. Para probar sin enviar correos reales se puede levantar un servidor local, por ejemplo:
+#   python -m aiosmtpd -n -l localhost:1025
+# Usuario y clave se leen de variables de entorno para no dejarlos en el código.
+smtp_config = {
+    'remitente': os.environ.get('SMTP_REMITENTE', 'notificaciones@irrigacion.gov.ar'),
+    'servidor': os.environ.get('SMTP_SERVIDOR', 'localhost'),
+    'puerto': int(os.environ.get('SMTP_PUERTO', '1025')),
+    'usuario': os.environ.get('SMTP_USUARIO'),
+    'clave': os.environ.get('SMTP_CLAVE'),
+    'usar_tls': os.environ.get('SMTP_TLS', '0') == '1',
+    'tamano_lote': 100,
+    'mensajes_por_segundo': 5.0,
+}
+
+# --- Ejecutar la función ---
+if __name__ == "__main__":
+    if os.path.exists(destinatarios_csv_file):
+        destinatarios = cargar_destinatarios(destinatarios_csv_file)
+    else:
+        destinatarios = destinatarios_por_defecto
+
+    if os.path.exists(programados_kml_file) and os.path.exists(exitosos_kml_file):
+        notificar(programados_kml_file, exitosos_kml_file, destinatarios, bandeja_file, smtp_config)
+    else:
+        print("Error: No se encontraron las capas 'Pozos Medidos/doc.kml' y 'Pozos Medidos Con Exito/doc.kml'.")
+        print("Asegúrate de ejecutar el script desde la carpeta 'Notificaciones' dentro de 'Cambios de Capas'.")
@@ -0,0 +1,212 @@
+import os
+import re
+import sys
+import json
+import math
+
+from parser_kml import KML_NS, abrir_kml, iterparse, ErroresParseo
+
+# Conversión de los tipos de <SimpleField type="..."> a tipos de Python/JSON
+TIPOS_ENTEROS = {'int', 'uint', 'short', 'ushort'}
+TIPOS_DECIMALES = {'float', 'double'}
+
+# Un número ya escrito como JSON válido se copia tal cual, sin pasar por float()
+numero_json_regex = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+comas_regex = re.compile(r'\s*,\s*')
+# int() y float() aceptan también '1_000', 'nan' o 'inf': los valores se validan antes de convertirlos
+entero_regex = re.compile(r'[+-]?\d+')
+decimal_regex = re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+
+
+def convertir_valor(texto, tipo):
+    """
+    Convierte el texto de un <SimpleData> según el tipo declarado en el <Schema>.
+    Los valores vacíos quedan como None y los que no se pueden convertir se dejan como texto.
+    """
+    if texto is None:
+        return None
+    texto = texto.strip()
+    if tipo in TIPOS_ENTEROS or tipo in TIPOS_DECIMALES or tipo == 'bool':
+        if not texto:
+            return None
+        if tipo in TIPOS_ENTEROS:
+            return int(texto) if entero_regex.fullmatch(texto) else texto
+        if tipo in TIPOS_DECIMALES:
+            if decimal_regex.fullmatch(texto):
+                numero = float(texto)
+                # Un exponente demasiado grande da inf, que no es un número JSON válido
+                if math.isfinite(numero):
+                    return numero
+            return texto
+        return texto.lower() in ('1', 'true')
+    return texto
+
+
+def coordenadas_a_json(texto):
+    """
+    Convierte el texto de <coordinates> ('lon,lat[,alt] lon,lat[,alt] ...') directamente
+    en el texto JSON de una lista de posiciones, sin crear listas ni floats intermedios.
+    Lanza ValueError si no hay posiciones o algún valor no es un número finito.
+    """
+    posiciones = []
+    # Los espacios alrededor de las comas ('-68.1, -34.5, 0') no separan posiciones
+    for tupla in comas_regex.sub(',', texto.strip()).split():
+        valores = tupla.strip(',').split(',')
+        if len(valores) < 2:
+            raise ValueError(f"posición incompleta '{tupla}'")
+        for i, valor in enumerate(valores):
+            if not numero_json_regex.fullmatch(valor):
+                # Formatos válidos en KML pero no en JSON (ej. '+68.1', '.5', '5.'): normalizamos.
+                # float() acepta 'nan' e 'inf', que no existen en JSON
+                try:
+                    numero = float(valor)
+                except ValueError:
+                    raise ValueError(f"valor no numérico '{valor}'") from None
+                if not math.isfinite(numero):
+                    raise ValueError(f"valor no finito '{valor}'")
+                valores[i] = repr(numero)
+        posiciones.append('[' + ','.join(valores) + ']')
+    if not posiciones:
+        raise ValueError("coordenadas vacías")
+    return '[' + ','.join(posiciones) + ']'
+
+
+def geometria_a_json(elem):
+    """
+    Devuelve el texto JSON de la geometría GeoJSON de un elemento KML, o None si no es una geometría.
+    Lanza ValueError si las coordenadas no son válidas.
+    """
+    tag = elem.tag
+    if tag == KML_NS + 'Point':
+        posiciones = coordenadas_a_json(elem.findtext(KML_NS + 'coordinates') or '')
+        # Un Point tiene una sola posición: quitamos la lista externa
+        if '],[' in posiciones:
+            raise ValueError("un Point con más de una posición")
+        return '{"type":"Point","coordinates":' + posiciones[1:-1] + '}'
+    if tag == KML_NS + 'LineString':
+        posiciones = coordenadas_a_json(elem.findtext(KML_NS + 'coordinates') or '')
+        return '{"type":"LineString","coordinates":' + posiciones + '}'
+    if tag == KML_NS + 'Polygon':
+        anillos = []
+        for borde in ('outerBoundaryIs', 'innerBoundaryIs'):
+            for anillo in elem.findall(f'{KML_NS}{borde}/{KML_NS}LinearRing/{KML_NS}coordinates'):
+                anillos.append(coordenadas_a_json(anillo.text or ''))
+        return '{"type":"Polygon","coordinates":[' + ','.join(anillos) + ']}'
+    if tag == KML_NS + 'MultiGeometry':
+        geometrias = [g for g in (geometria_a_json(hijo) for hijo in elem) if g is not None]
+        return '{"type":"GeometryCollection","geometries":[' + ','.join(geometrias) + ']}'
+    return None
+
+
+def iterar_features(kml_file):
+    """
+    Recorre un KML en streaming y genera, por cada Placemark, la línea JSON de su Feature.
+    Cada Placemark se quita del árbol apenas se procesa, así la memoria no depende del tamaño de la capa.
+    """
+    # Tipos por esquema: {'#id_schema': {'campo': 'tipo'}}
+    esquemas = {}
+    pila = []
+
+    for evento, elem in iterparse(kml_file, ('start', 'end')):
+        if evento == 'start':
+            pila.append(elem)
+            continue
+
+        pila.pop()
+        if elem.tag == KML_NS + 'Schema':
+            campos = {campo.get('name'): campo.get('type', 'string') for campo in elem.findall(KML_NS + 'SimpleField')}
+            esquemas['#' + elem.get('id', elem.get('name', ''))] = campos
+            continue
+        if elem.tag != KML_NS + 'Placemark':
+            continue
+
+        propiedades = {}
+        nombre = elem.findtext(KML_NS + 'name')
+        if nombre is not None:
+            propiedades['name'] = nombre.strip()
+        descripcion = elem.findtext(KML_NS + 'description')
+        if descripcion is not None:
+            propiedades['description'] = descripcion
+
+        for schema_data in elem.iterfind(f'{KML_NS}ExtendedData/{KML_NS}SchemaData'):
+            tipos = esquemas.get(schema_data.get('schemaUrl', ''), {})
+            for simple_data in schema_data.iterfind(KML_NS + 'SimpleData'):
+                campo = simple_data.get('name')
+                propiedades[campo] = convertir_valor(simple_data.text, tipos.get(campo, 'string'))
+
+        geometria = 'null'
+        try:
+            for hijo in elem:
+                geometria_json = geometria_a_json(hijo)
+                if geometria_json is not None:
+                    geometria = geometria_json
+                    break
+        except ValueError as e:
+            # Una geometría inválida no corta la exportación: la Feature se escribe sin geometría
+            print(f"Advertencia: Geometría inválida en el Placemark '{elem.get('id') or propiedades.get('name', '')}': {e}. "
+                  "Se exporta sin geometría.", file=sys.stderr)
+
+        feature_id = elem.get('id')
+        linea = '{"type":"Feature",'
+        if feature_id is not None:
+            linea += '"id":' + json.dumps(feature_id, ensure_ascii=False) + ','
+        linea += '"geometry":' + geometria + ',"properties":' + json.dumps(propiedades, ensure_ascii=False, allow_nan=False) + '}'
+        yield linea
+
+        # Quitamos el Placemark de su padre para no acumular elementos ya procesados
+        if pila:
+            pila[-1].remove(elem)
+        elem.clear()
+
+
+def exportar_geojson(input_kml_path, output_geojson_path):
+    """
+    Exporta los Placemarks de un KML (o KMZ) a GeoJSON delimitado por líneas:
+    una Feature por línea, que el visor puede ir leyendo a medida que llega.
+    Las propiedades toman el tipo declarado en los <SimpleField> del <Schema>.
+
+    Args:
+        input_kml_path (str): Ruta al archivo KML/KMZ de entrada.
+        output_geojson_path (str): Ruta del archivo .geojsonl de salida ('-' para la salida estándar).
+
+    Returns:
+        bool: True si la exportación terminó bien.
+    """
+    try:
+        salida = sys.stdout if output_geojson_path == '-' else open(output_geojson_path, 'w', encoding='utf-8', newline='\n')
+        cantidad = 0
+        try:
+            kml_file, _ = abrir_kml(input_kml_path)
+            with kml_file:
+                for linea in iterar_features(kml_file):
+                    salida.write(linea)
+                    salida.write('\n')
+                    cantidad += 1
+        finally:
+            if salida is not sys.stdout:
+                salida.close()
+
+        print(f"¡Éxito! Se exportaron {cantidad} Features de '{input_kml_path}' a: {output_geojson_path}", file=sys.stderr)
+        return True
+
+    except FileNotFoundError as e:
+        print(f"Error: El archivo '{input_kml_path}' no fue encontrado. {e}", file=sys.stderr)
+    except ErroresParseo as e:
+        print(f"Error al parsear el archivo KML: {e}. Asegúrate de que es un XML válido.", file=sys.stderr)
+    except Exception as e:
+        print(f"Ocurrió un error inesperado: {e}", file=sys.stderr)
+    return False
+
+
+# --- Ejecutar la función ---
+# Uso: python exportar_geojson.py <entrada.kml|entrada.kmz> <salida.geojsonl | ->
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python exportar_geojson.py <entrada.kml|entrada.kmz> <salida.geojsonl | ->", file=sys.stderr)
+        sys.exit(2)
+    input_kml_file, output_geojson_file = sys.argv[1], sys.argv[2]
+    if os.path.exists(input_kml_file):
+        sys.exit(0 if exportar_geojson(input_kml_file, output_geojson_file) else 1)
+    else:
+        print(f"Error: El archivo de entrada '{input_kml_file}' no existe.", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,277 @@
+import io
+import os
+import re
+import sys
+import hashlib
+import zipfile
+from xml.sax.saxutils import escape
+
+from parser_kml import KML_NS, abrir_kml, iterparse, serializar, declaraciones_raiz, ErroresParseo
+
+espacios_entre_etiquetas_regex = re.compile(r'>\s+<')
+
+# Elementos compartidos del <Document> que se deduplican entre capas
+ETIQUETAS_COMPARTIDAS = (KML_NS + 'Schema', KML_NS + 'Style', KML_NS + 'StyleMap')
+
+
+def es_href_local(href):
+    """Los íconos con URL (http://, https://) se dejan como están; solo se empaquetan los archivos locales."""
+    return bool(href) and '://' not in href and not href.startswith('#')
+
+
+def forma_canonica(elem):
+    """Texto que identifica el contenido de un Style/StyleMap/Schema sin tener en cuenta su id."""
+    return espacios_entre_etiquetas_regex.sub('><', serializar(elem, omitir_id=True)).strip()
+
+
+class FusionadorCapas:
+    """
+    Acumula los Schema/Style/StyleMap y los íconos de todas las capas, deduplicándolos por contenido.
+    Cada capa guarda su propio mapeo de ids viejos a ids finales para reescribir los Placemarks.
+    """
+
+    def __init__(self):
+        self.compartidos = []          # elementos finales, en orden de aparición
+        self.ids_por_contenido = {}    # forma canónica -> id final
+        self.ids_usados = set()
+        self.iconos = {}               # ruta en el KMZ -> bytes
+        self.iconos_por_hash = {}      # sha1 -> ruta en el KMZ
+
+    def _id_libre(self, id_original):
+        base = id_original or 'estilo'
+        nuevo_id = base
+        sufijo = 1
+        while nuevo_id in self.ids_usados:
+            nuevo_id = f"{base}_{sufijo}"
+            sufijo += 1
+        self.ids_usados.add(nuevo_id)
+        return nuevo_id
+
+    def registrar_icono(self, href, leer_auxiliar):
+        """Guarda el ícono una sola vez (por contenido) y devuelve el href que tendrá dentro del KMZ."""
+        datos = leer_auxiliar(href)
+        if datos is None:
+            print(f"Advertencia: No se encontró el ícono '{href}'. Se deja la referencia sin empaquetar.")
+            return href
+        huella = hashlib.sha1(datos).hexdigest()
+        if huella in self.iconos_por_hash:
+            return self.iconos_por_hash[huella]
+
+        base, extension = os.path.splitext(os.path.basename(href))
+        destino = f"files/{base}{extension}"
+        sufijo = 1
+        while destino in self.iconos:
+            destino = f"files/{base}_{sufijo}{extension}"
+            sufijo += 1
+        self.iconos[destino] = datos
+        self.iconos_por_hash[huella] = destino
+        return destino
+
+    def registrar(self, elem, mapa_ids, mapa_hrefs, leer_auxiliar):
+        """Incorpora un Schema/Style/StyleMap de una capa y anota a qué id final quedó asociado."""
+        for href_elem in elem.iter(KML_NS + 'href'):
+            href = (href_elem.text or '').strip()
+            if es_href_local(href):
+                if href not in mapa_hrefs:
+                    mapa_hrefs[href] = self.registrar_icono(href, leer_auxiliar)
+                href_elem.text = mapa_hrefs[href]
+        # Los StyleMap apuntan a Style de la misma capa: se reescriben antes de comparar contenidos
+        reescribir_referencias(elem, mapa_ids)
+
+        canonica = forma_canonica(elem)
+        id_original = elem.get('id', '')
+        if canonica in self.ids_por_contenido:
+            id_final = self.ids_por_contenido[canonica]
+        else:
+            id_final = self._id_libre(id_original)
+            self.ids_por_contenido[canonica] = id_final
+            elem.set('id', id_final)
+            self.compartidos.append(elem)
+        if id_original:
+            mapa_ids['#' + id_original] = '#' + id_final
+
+
+def reescribir_referencias(elem, mapa_ids, mapa_hrefs=None):
+    """Actualiza styleUrl, schemaUrl y (opcionalmente) los href de íconos según los mapeos de la capa."""
+    for style_url in elem.iter(KML_NS + 'styleUrl'):
+        texto = (style_url.text or '').strip()
+        if texto in mapa_ids:
+            style_url.text = mapa_ids[texto]
+    for schema_data in elem.iter(KML_NS + 'SchemaData'):
+        url = schema_data.get('schemaUrl')
+        if url in mapa_ids:
+            schema_data.set('schemaUrl', mapa_ids[url])
+    if mapa_hrefs:
+        for href_elem in elem.iter(KML_NS + 'href'):
+            texto = (href_elem.text or '').strip()
+            if texto in mapa_hrefs:
+                href_elem.text = mapa_hrefs[texto]
+
+
+def leer_estilos_capa(kml_path, fusionador):
+    """
+    Primera pasada por la capa: registra Schema/Style/StyleMap compartidos y averigua el nombre de la capa.
+    Los Placemarks se descartan a medida que se leen, así que la capa nunca está entera en memoria.
+    """
+    mapa_ids = {}
+    mapa_hrefs = {}
+    nombre_documento = nombre_carpeta = None
+    compartidos = []
+    pila = []
+
+    kml_file, leer_auxiliar = abrir_kml(kml_path)
+    with kml_file:
+        for evento, elem in iterparse(kml_file, ('start', 'end')):
+            if evento == 'start':
+                pila.append(elem)
+                continue
+            pila.pop()
+            padre = pila[-1] if pila else None
+            if padre is None:
+                continue
+
+            if elem.tag in ETIQUETAS_COMPARTIDAS and padre.tag in (KML_NS + 'Document', KML_NS + 'Folder'):
+                compartidos.append(elem)
+                padre.remove(elem)
+            elif elem.tag == KML_NS + 'name':
+                if padre.tag == KML_NS + 'Document' and nombre_documento is None:
+                    nombre_documento = (elem.text or '').strip()
+                elif padre.tag == KML_NS + 'Folder' and nombre_carpeta is None:
+                    nombre_carpeta = (elem.text or '').strip()
+            elif elem.tag == KML_NS + 'Placemark':
+                padre.remove(elem)
+
+    # Los StyleMap suelen aparecer antes que los Style a los que apuntan:
+    # registramos primero Schema y Style para que sus ids finales ya estén en el mapeo
+    prioridad = {KML_NS + 'Schema': 0, KML_NS + 'Style': 1, KML_NS + 'StyleMap': 2}
+    for elem in sorted(compartidos, key=lambda e: prioridad[e.tag]):
+        fusionador.registrar(elem, mapa_ids, mapa_hrefs, leer_auxiliar)
+
+    nombre_capa = nombre_carpeta or re.sub(r'\.km[lz]$', '', nombre_documento or '', flags=re.I)
+    if not nombre_capa:
+        nombre_capa = os.path.splitext(os.path.basename(kml_path))[0]
+    return nombre_capa, mapa_ids, mapa_hrefs
+
+
+def escribir_placemarks_capa(kml_path, salida, mapa_ids, mapa_hrefs):
+    """Segunda pasada: copia los Placemarks de la capa a la salida, uno por vez, con las referencias actualizadas."""
+    cantidad = 0
+    pila = []
+    kml_file, _ = abrir_kml(kml_path)
+    with kml_file:
+        for evento, elem in iterparse(kml_file, ('start', 'end')):
+            if evento == 'start':
+                pila.append(elem)
+                continue
+            pila.pop()
+            if elem.tag != KML_NS + 'Placemark':
+                continue
+
+            reescribir_referencias(elem, mapa_ids, mapa_hrefs)
+            salida.write('\t\t')
+            salida.write(serializar(elem))
+            salida.write('\n')
+            cantidad += 1
+
+            if pila:
+                pila[-1].remove(elem)
+    return cantidad
+
+
+def fusionar_capas(input_kml_paths, output_kmz_path, nombre_documento='Capas fusionadas'):
+    """
+    Fusiona varias capas procesadas en un único KMZ con una carpeta (<Folder>) por capa.
+    Los Schema, Style y StyleMap repetidos se guardan una sola vez y los íconos se empaquetan
+    una vez en 'files/'. Cada capa se lee en streaming (dos pasadas) en lugar de cargar su árbol completo.
+
+    Args:
+        input_kml_paths (list): Rutas de las capas (.kml o .kmz/.zip).
+        output_kmz_path (str): Ruta del KMZ de salida.
+        nombre_documento (str): Nombre del <Document> fusionado.
+
+    Returns:
+        bool: True si el KMZ se generó correctamente.
+    """
+    try:
+        fusionador = FusionadorCapas()
+        capas = []
+        for kml_path in input_kml_paths:
+            nombre_capa, mapa_ids, mapa_hrefs = leer_estilos_capa(kml_path, fusionador)
+            capas.append((kml_path, nombre_capa, mapa_ids, mapa_hrefs))
+            print(f"Capa '{nombre_capa}' leída desde '{kml_path}'.")
+
+        # Escribimos primero en un archivo temporal para no dejar un KMZ a medias si algo falla
+        temporal_path = output_kmz_path + '.tmp'
+        try:
+            with zipfile.ZipFile(temporal_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+                # Google Earth abre el primer .kml del KMZ, por eso doc.kml va antes que los íconos
+                with zf.open('doc.kml', 'w', force_zip64=True) as binario:
+                    salida = io.TextIOWrapper(binario, encoding='utf-8', newline='\n')
+                    salida.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+                    salida.write(f'<kml {declaraciones_raiz()}>\n<Document>\n')
+                    salida.write(f'\t<name>{escape(nombre_documento)}</name>\n')
+                    for elem in fusionador.compartidos:
+                        salida.write('\t' + serializar(elem) + '\n')
+
+                    for kml_path, nombre_capa, mapa_ids, mapa_hrefs in capas:
+                        salida.write(f'\t<Folder>\n\t\t<name>{escape(nombre_capa)}</name>\n')
+                        cantidad = escribir_placemarks_capa(kml_path, salida, mapa_ids, mapa_hrefs)
+                        salida.write('\t</Folder>\n')
+                        print(f"  {nombre_capa}: {cantidad} Placemarks")
+
+                    salida.write('</Document>\n</kml>\n')
+                    salida.flush()
+                    salida.detach()
+
+                for destino, datos in fusionador.iconos.items():
+                    zf.writestr(destino, datos)
+
+            os.replace(temporal_path, output_kmz_path)
+        finally:
+            # Si algo falló antes del os.replace no dejamos el temporal a medias
+            if os.path.exists(temporal_path):
+                os.remove(temporal_path)
+
+        print(f"\n¡Éxito! {len(capas)} capas fusionadas con {len(fusionador.compartidos)} estilos/esquemas "
+              f"y {len(fusionador.iconos)} íconos en: {output_kmz_path}")
+        return True
+
+    except FileNotFoundError as e:
+        print(f"Error: El archivo '{e.filename or e}' no fue encontrado.")
+    except ErroresParseo as e:
+        print(f"Error al parsear el archivo KML: {e}. Asegúrate de que es un XML válido.")
+    except Exception as e:
+        print(f"Ocurrió un error inesperado: {e}")
+    return False
+
+
+# --- Configuración ---
+# Capas procesadas que forman el paquete diario (rutas relativas a la carpeta 'Cambios de Capas').
+# Se pueden pasar otras por línea de comandos: python fusionar_capas.py salida.kmz capa1.kml capa2.kmz ...
+input_kml_files = [
+    'Pozos San Rafael/pozos_san_rafael_ordenados.kml',
+    'Pozos Medidos/monitoreo_aguas_subterranea_ordenado_solo_por_nombre.kml',
+    'Pozos Medidos Con Exito/medidos_con_exito_2025_ordenados.kml',
+    'Superficial/padriones_ordenados_con_atributos.kml',
+]
+output_kmz_file = 'capas_diarias.kmz'
+
+# --- Ejecutar la función ---
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        output_kmz_file, input_kml_files = sys.argv[1], sys.argv[2:]
+    else:
+        # Sin argumentos, las rutas se toman relativas a la carpeta de este script
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        input_kml_files = [os.path.join(base_dir, ruta) for ruta in input_kml_files]
+        output_kmz_file = os.path.join(base_dir, output_kmz_file)
+
+    existentes = [ruta for ruta in input_kml_files if os.path.exists(ruta)]
+    for ruta in input_kml_files:
+        if ruta not in existentes:
+            print(f"Advertencia: La capa '{ruta}' no existe. Ejecuta primero el script de esa capa.")
+
+    if existentes:
+        fusionar_capas(existentes, output_kmz_file)
+    else:
+        print("Error: No se encontró ninguna de las capas a fusionar.")
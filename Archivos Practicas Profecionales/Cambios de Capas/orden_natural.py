@@ -0,0 +1,154 @@
+import re
+import math
+from array import array
+
+# numpy es opcional: si está instalado, el orden final se hace con un único numpy.lexsort;
+# si no, se ordenan las mismas columnas con sorted() y el resultado es idéntico.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Motor de orden de las capas. Las claves tienen el formato de reglas_capas.py:
+# (0, números...) para valores numéricos, (1, texto) para el resto y (2,) para valores vacíos.
+# En lugar de comparar tuplas de Python en cada paso del sort, las claves de cada campo se
+# convierten una sola vez en columnas numéricas (array 'q' de enteros de 64 bits, o 'd' si hay
+# decimales: sin un objeto por valor)
+# y se ordenan todas las columnas juntas, de la más a la menos significativa.
+
+numeros_regex = re.compile(r'\d+')
+# Un único número, con signo y parte decimal opcionales (ej. '-5', '26.8', '1.25', '1e3')
+numero_regex = re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+entero_regex = re.compile(r'[+-]?\d+')
+letras_regex = re.compile(r'[^\W\d_]')
+trozos_regex = re.compile(r'(\d+)')
+
+CLAVE_VACIA = (2,)
+
+
+def clave_natural(texto):
+    """
+    Clave de orden natural de un valor de texto (ej. un SimpleData).
+    Un único número se ordena por su valor, con signo y decimales: '-5' < '1.25' < '1.5' < '3' < '11'
+    (separarlo en tramos de dígitos pondría 1.5 antes que 1.25 y -5 después de 3).
+    Un código con varios números separados por espacios o signos se ordena por cada número:
+    '17 0234' -> (0, 17, 234). Si tiene letras se ordena como texto y los valores vacíos van al final.
+
+    Args:
+        texto (str): Valor a ordenar (puede ser None).
+
+    Returns:
+        tuple: Clave con el formato de reglas_capas.py.
+    """
+    if texto is None:
+        return CLAVE_VACIA
+    texto = texto.strip()
+    if not texto:
+        return CLAVE_VACIA
+    if numero_regex.fullmatch(texto):
+        # Los enteros quedan como int (sin perder precisión en códigos largos); los decimales como float
+        if entero_regex.fullmatch(texto):
+            return (0, int(texto))
+        numero = float(texto)
+        if math.isfinite(numero):
+            return (0, numero)
+    if letras_regex.search(texto) is None:
+        numeros = numeros_regex.findall(texto)
+        if numeros:
+            return (0, *map(int, numeros))
+    return (1, texto)
+
+
+def clave_texto(texto):
+    """Orden natural entre textos: los trozos numéricos se comparan como números ('P-9' antes que 'P-10')."""
+    # split con un grupo alterna texto (posiciones pares) y dígitos (impares), así cada posición
+    # compara siempre el mismo tipo. El texto original desempata para que el orden sea total.
+    trozos = trozos_regex.split(texto)
+    return tuple(int(trozo) if i % 2 else trozo.casefold() for i, trozo in enumerate(trozos)), texto
+
+
+def columna_numerica(valores):
+    """
+    Columna array('q') con los valores (array('d') si hay decimales); si alguno no entra
+    en 64 bits se guarda su rango en su lugar.
+    """
+    try:
+        if any(isinstance(valor, float) for valor in valores):
+            return array('d', valores)
+        return array('q', valores)
+    except OverflowError:
+        rangos = {valor: i for i, valor in enumerate(sorted(set(valores)))}
+        return array('q', map(rangos.__getitem__, valores))
+
+
+def columnas_de_claves(claves):
+    """
+    Convierte las claves de un campo (una por elemento) en columnas numéricas que ordenan
+    igual que comparar las tuplas: el grupo, un número por posición y el rango natural del texto.
+    Las columnas que tienen el mismo valor en todos los elementos se omiten.
+
+    Args:
+        claves (list): Claves con el formato de reglas_capas.py.
+
+    Returns:
+        list: Columnas array('q') o array('d'), de la más a la menos significativa.
+    """
+    columnas = []
+    grupos = array('q', (clave[0] for clave in claves))
+    if min(grupos) != max(grupos):
+        columnas.append(grupos)
+
+    numericas = [clave for clave in claves if clave[0] == 0]
+    ancho = max((len(clave) - 1 for clave in numericas), default=0)
+    for posicion in range(1, ancho + 1):
+        presentes = [clave[posicion] for clave in numericas if len(clave) > posicion]
+        # El relleno es menor que cualquier número de la posición: como en las tuplas,
+        # la clave más corta va antes ((0, 5) < (0, 5, 1))
+        relleno = min(min(presentes) - 1, -1)
+        valores = [clave[posicion] if clave[0] == 0 and len(clave) > posicion else relleno for clave in claves]
+        if min(valores) != max(valores):
+            columnas.append(columna_numerica(valores))
+
+    textos = {clave[1] for clave in claves if clave[0] == 1}
+    if len(textos) > 1:
+        # Solo se ordenan los textos distintos; cada elemento guarda el rango de su texto
+        rangos = {texto: i for i, texto in enumerate(sorted(textos, key=clave_texto))}
+        columnas.append(array('q', (rangos[clave[1]] if clave[0] == 1 else 0 for clave in claves)))
+    return columnas
+
+
+def orden_lexicografico(columnas, cantidad):
+    """
+    Índices que ordenan las filas por las columnas (la primera es la principal).
+    El orden es estable, como sorted(): los empates mantienen su posición original.
+    """
+    if not columnas or cantidad < 2:
+        return list(range(cantidad))
+    if numpy is not None:
+        # lexsort usa la última clave como la principal; frombuffer no copia los datos
+        tipos = {'q': numpy.int64, 'd': numpy.float64}
+        return numpy.lexsort([numpy.frombuffer(columna, dtype=tipos[columna.typecode])
+                              for columna in reversed(columnas)]).tolist()
+    filas = list(zip(*columnas))
+    return sorted(range(cantidad), key=filas.__getitem__)
+
+
+def permutacion(claves_por_campo):
+    """
+    Calcula el orden de varios elementos a partir de las claves de uno o más campos.
+
+    Args:
+        claves_por_campo (list): Una lista de claves por campo, del más al menos significativo
+            (ej. [claves de 'uso', claves de 'dp_pozo']). Todas tienen una clave por elemento.
+
+    Returns:
+        list: Índices de los elementos en el orden resultante.
+    """
+    cantidad = len(claves_por_campo[0]) if claves_por_campo else 0
+    columnas = []
+    for claves in claves_por_campo:
+        if len(claves) != cantidad:
+            raise ValueError("Todos los campos de orden deben tener una clave por elemento.")
+        if cantidad:
+            columnas.extend(columnas_de_claves(claves))
+    return orden_lexicografico(columnas, cantidad)
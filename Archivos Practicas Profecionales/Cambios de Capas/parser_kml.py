@@ -0,0 +1,305 @@
+import xml.etree.ElementTree as ET
+import os
+import re
+import sys
+import zipfile
+
+# Punto único de lectura/escritura de KML para todas las herramientas de 'Cambios de Capas'.
+# - Backends de árbol (iterparse): 'lxml' (en C, opcional) o 'elementtree' (biblioteca estándar).
+#   Se elige el más rápido instalado al importar el módulo; la variable de entorno KML_PARSER
+#   permite forzar uno ('lxml' o 'elementtree').
+# - Escaneo por expresiones regulares sobre bytes: camino rápido para las exportaciones del servidor
+#   de mapas (XML bien formado), usado por registros_kml.py.
+# La serialización es propia y no depende del backend, así el resultado es idéntico con cualquiera.
+
+KML_URI = 'http://www.opengis.net/kml/2.2'
+KML_NS = '{' + KML_URI + '}'
+NAMESPACES = {
+    '': KML_URI,
+    'gx': 'http://www.google.com/kml/ext/2.2',
+    'kml': KML_URI,
+    'atom': 'http://www.w3.org/2005/Atom',
+}
+# Prefijo que se usa al escribir cada namespace (el KML va como namespace por defecto)
+PREFIJOS = {
+    KML_URI: '',
+    NAMESPACES['gx']: 'gx',
+    NAMESPACES['atom']: 'atom',
+}
+
+
+class BackendElementTree:
+    """xml.etree.ElementTree de la biblioteca estándar (usa el acelerador _elementtree de CPython)."""
+    nombre = 'elementtree'
+    ErrorParseo = ET.ParseError
+
+    def iterparse(self, fuente, eventos=('end',)):
+        return ET.iterparse(fuente, events=eventos)
+
+
+class BackendLxml:
+    """lxml.etree (libxml2). Mismo API de elementos que ElementTree para lo que usan las herramientas."""
+    nombre = 'lxml'
+
+    def __init__(self):
+        from lxml import etree
+        self.etree = etree
+        self.ErrorParseo = etree.XMLSyntaxError
+
+    def iterparse(self, fuente, eventos=('end',)):
+        # Sin comentarios ni instrucciones de proceso, igual que el iterparse de ElementTree
+        return self.etree.iterparse(fuente, events=eventos, remove_comments=True, remove_pis=True,
+                                    huge_tree=True, resolve_entities=False)
+
+
+def backends_disponibles():
+    """Backends de árbol instalados, del más rápido al más lento."""
+    backends = {}
+    try:
+        backends['lxml'] = BackendLxml()
+    except ImportError:
+        pass
+    backends['elementtree'] = BackendElementTree()
+    return backends
+
+
+def elegir_backend(preferido=None):
+    """Devuelve el backend pedido (o el de KML_PARSER); si no se pide ninguno, el más rápido disponible."""
+    disponibles = backends_disponibles()
+    preferido = preferido or os.environ.get('KML_PARSER')
+    if preferido:
+        if preferido not in disponibles:
+            print(f"Advertencia: El parser '{preferido}' no está disponible. Se usará '{next(iter(disponibles))}'.",
+                  file=sys.stderr)
+        else:
+            return disponibles[preferido]
+    return next(iter(disponibles.values()))
+
+
+backend = elegir_backend()
+
+# Excepciones de parseo de todos los backends instalados, para usar en los 'except'
+ErroresParseo = tuple({b.ErrorParseo for b in backends_disponibles().values()})
+
+
+def iterparse(fuente, eventos=('end',)):
+    """iterparse del backend elegido. 'fuente' puede ser una ruta o un flujo binario."""
+    return backend.iterparse(fuente, eventos)
+
+
+def abrir_kml(kml_path):
+    """
+    Abre un .kml o el doc.kml de un .kmz/.zip como flujo binario (sin descomprimir a disco).
+    Devuelve (flujo, función para leer archivos auxiliares como íconos por su href relativo).
+    """
+    if zipfile.is_zipfile(kml_path):
+        zf = zipfile.ZipFile(kml_path)
+        nombres = [n for n in zf.namelist() if n.lower().endswith('.kml')]
+        if not nombres:
+            zf.close()
+            raise FileNotFoundError(f"No hay ningún .kml dentro de '{kml_path}'")
+        nombre = 'doc.kml' if 'doc.kml' in nombres else nombres[0]
+
+        def leer_auxiliar(href):
+            try:
+                return zf.read(href)
+            except KeyError:
+                return None
+        return zf.open(nombre), leer_auxiliar
+
+    carpeta = os.path.dirname(os.path.abspath(kml_path))
+
+    def leer_auxiliar(href):
+        ruta = os.path.join(carpeta, *href.split('/'))
+        if not os.path.isfile(ruta):
+            return None
+        with open(ruta, 'rb') as f:
+            return f.read()
+    return open(kml_path, 'rb'), leer_auxiliar
+
+
+def declaraciones_raiz():
+    """Atributos xmlns para la etiqueta <kml> de los documentos que generan las herramientas."""
+    return ' '.join(
+        f'xmlns="{uri}"' if not prefijo else f'xmlns:{prefijo}="{uri}"'
+        for prefijo, uri in NAMESPACES.items()
+    )
+
+
+# --- Serialización ---
+
+def _escapar_texto(texto):
+    if '&' in texto:
+        texto = texto.replace('&', '&amp;')
+    if '<' in texto:
+        texto = texto.replace('<', '&lt;')
+    if '>' in texto:
+        texto = texto.replace('>', '&gt;')
+    return texto
+
+
+def _escapar_atributo(texto):
+    texto = _escapar_texto(texto)
+    if '"' in texto:
+        texto = texto.replace('"', '&quot;')
+    if '\r' in texto:
+        texto = texto.replace('\r', '&#13;')
+    if '\n' in texto:
+        texto = texto.replace('\n', '&#10;')
+    if '\t' in texto:
+        texto = texto.replace('\t', '&#09;')
+    return texto
+
+
+def _nombre_calificado(qname, declaraciones):
+    """Convierte '{uri}local' al nombre con prefijo. Los namespaces desconocidos se declaran en el elemento."""
+    if qname[:1] != '{':
+        return qname
+    uri, local = qname[1:].split('}', 1)
+    prefijo = PREFIJOS.get(uri)
+    if prefijo is None:
+        prefijo = f'ns{len(declaraciones)}'
+        declaraciones.append(f' xmlns:{prefijo}="{_escapar_atributo(uri)}"')
+    return f'{prefijo}:{local}' if prefijo else local
+
+
+def _serializar(elem, partes):
+    declaraciones = []
+    etiqueta = _nombre_calificado(elem.tag, declaraciones)
+    atributos = ''.join(
+        f' {_nombre_calificado(nombre, declaraciones)}="{_escapar_atributo(valor)}"'
+        for nombre, valor in elem.items()
+    )
+    partes.append(f'<{etiqueta}{"".join(declaraciones)}{atributos}')
+
+    hijos = [hijo for hijo in elem if isinstance(hijo.tag, str)]
+    if elem.text or hijos:
+        partes.append('>')
+        if elem.text:
+            partes.append(_escapar_texto(elem.text))
+        for hijo in hijos:
+            _serializar(hijo, partes)
+            if hijo.tail:
+                partes.append(_escapar_texto(hijo.tail))
+        partes.append(f'</{etiqueta}>')
+    else:
+        partes.append(' />')
+
+
+def serializar(elem, omitir_id=False):
+    """
+    Serializa un elemento (de cualquier backend) sin su tail, usando los prefijos de NAMESPACES.
+    No repite las declaraciones de namespace: se asume que ya están en la raíz del documento.
+
+    Args:
+        elem (Element): Elemento a serializar.
+        omitir_id (bool): Si es True no se escribe el atributo 'id' del elemento (para comparar contenidos).
+    """
+    partes = []
+    if omitir_id and 'id' in elem.attrib:
+        id_original = elem.get('id')
+        del elem.attrib['id']
+        try:
+            _serializar(elem, partes)
+        finally:
+            elem.set('id', id_original)
+    else:
+        _serializar(elem, partes)
+    return ''.join(partes)
+
+
+# --- Camino rápido: escaneo de bytes con expresiones regulares ---
+# Los prefijos opcionales ((?:\w+:)?) permiten leer también los KML guardados con 'kml:Placemark'.
+# Cada expresión de escaneo empieza con una alternativa que consume comentarios y secciones CDATA,
+# así lo que haya dentro de ellos (ej. un Placemark comentado) no se toma como un elemento.
+# En todas, el grupo 1 (el prefijo) solo participa cuando el match es el elemento buscado.
+
+SALTEAR = rb'<!--.*?-->|<!\[CDATA\[.*?\]\]>|'
+
+placemark_regex = re.compile(rb'<((?:\w+:)?)Placemark\b[^>]*>.*?</\1Placemark>', re.S)
+escaneo_placemark_regex = re.compile(SALTEAR + placemark_regex.pattern, re.S)
+name_regex = re.compile(SALTEAR + rb'<((?:\w+:)?)name>(.*?)</\1name>', re.S)
+simple_data_regex = re.compile(SALTEAR + rb'<((?:\w+:)?)SimpleData\s+name="([^"]*)"\s*(?:/>|>(.*?)</\1SimpleData>)', re.S)
+id_regex = re.compile(rb'\sid="([^"]*)"')
+folder_abre_regex = re.compile(SALTEAR + rb'<((?:\w+:)?)Folder\b[^>]*>', re.S)
+folder_cierra_regex = re.compile(SALTEAR + rb'</((?:\w+:)?)Folder>', re.S)
+entidad_regex = re.compile(r'&(#x[0-9a-fA-F]+|#\d+|amp|lt|gt|quot|apos);')
+cdata_regex = re.compile(r'<!\[CDATA\[(.*?)\]\]>', re.S)
+
+ENTIDADES = {'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'"}
+
+
+def buscar_elementos(regex, contenido, inicio=0, fin=None):
+    """Genera los matches de una expresión de escaneo, salteando comentarios y secciones CDATA."""
+    if fin is None:
+        fin = len(contenido)
+    for match in regex.finditer(contenido, inicio, fin):
+        if match.group(1) is not None:
+            yield match
+
+
+def buscar_elemento(regex, contenido, inicio=0, fin=None):
+    """Primer match de una expresión de escaneo fuera de comentarios y CDATA, o None."""
+    return next(buscar_elementos(regex, contenido, inicio, fin), None)
+
+
+def _reemplazar_entidad(match):
+    entidad = match.group(1)
+    if entidad.startswith('#x'):
+        return chr(int(entidad[2:], 16))
+    if entidad.startswith('#'):
+        return chr(int(entidad[1:]))
+    return ENTIDADES[entidad]
+
+
+def desescapar(texto_bytes):
+    """Decodifica el texto de un elemento XML (UTF-8 + entidades). El contenido de CDATA se toma literal."""
+    texto = texto_bytes.decode('utf-8')
+    if '<![CDATA[' in texto:
+        partes = []
+        posicion = 0
+        for match in cdata_regex.finditer(texto):
+            partes.append(entidad_regex.sub(_reemplazar_entidad, texto[posicion:match.start()]))
+            partes.append(match.group(1))
+            posicion = match.end()
+        partes.append(entidad_regex.sub(_reemplazar_entidad, texto[posicion:]))
+        return ''.join(partes)
+    if '&' not in texto:
+        return texto
+    return entidad_regex.sub(_reemplazar_entidad, texto)
+
+
+def escanear_placemarks(contenido, inicio=0, fin=None):
+    """
+    Recorre los Placemarks del contenido (bytes o mmap) sin parsear XML.
+    Genera tuplas (match del Placemark, id, match del <name> o None, lista de (campo, valor) de SimpleData).
+    Los valores vacíos quedan como None, igual que el .text de los backends de árbol.
+    """
+    for match in buscar_elementos(escaneo_placemark_regex, contenido, inicio, fin):
+        bloque = match.group(0)
+        fin_apertura = bloque.index(b'>') + 1
+        id_match = id_regex.search(bloque, 0, fin_apertura)
+        placemark_id = desescapar(id_match.group(1)) if id_match else None
+        name_match = buscar_elemento(name_regex, bloque)
+        datos = []
+        for simple_data in buscar_elementos(simple_data_regex, bloque):
+            _, campo, valor = simple_data.groups()
+            valor = desescapar(valor) if valor else None
+            datos.append((desescapar(campo), valor or None))
+        yield match, placemark_id, name_match, datos
+
+
+def rango_primera_carpeta(contenido):
+    """
+    Devuelve (inicio, fin) del contenido de la primera <Folder>.
+    Las carpetas anidadas no están soportadas en el camino rápido.
+    """
+    abre = buscar_elemento(folder_abre_regex, contenido)
+    if abre is None:
+        raise ValueError("No se encontró la etiqueta <Folder> que contiene los Placemarks.")
+    cierra = buscar_elemento(folder_cierra_regex, contenido, abre.end())
+    if cierra is None:
+        raise ValueError("La etiqueta <Folder> no está cerrada. Asegúrate de que es un XML válido.")
+    if buscar_elemento(folder_abre_regex, contenido, abre.end(), cierra.start()):
+        raise ValueError("La carpeta de Placemarks tiene carpetas anidadas; este formato no está soportado.")
+    return abre.end(), cierra.start()
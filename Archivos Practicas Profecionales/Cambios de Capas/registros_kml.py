@@ -0,0 +1,187 @@
+import os
+import re
+import sys
+import mmap
+from operator import attrgetter
+from xml.sax.saxutils import escape
+
+from parser_kml import escanear_placemarks, rango_primera_carpeta, placemark_regex, desescapar
+from orden_natural import clave_natural, permutacion
+
+# Camino liviano para los scripts que solo cambian <name> y reordenan Placemarks.
+# En lugar de armar el árbol completo, se recorre el archivo (mapeado en memoria) con el escaneo
+# de bytes de parser_kml.py buscando el rango de cada Placemark. Por cada uno se guarda un registro
+# chico con el nombre, los SimpleData, la clave de orden y el rango; al escribir se copian los bytes
+# originales tal cual y solo se reemplaza el texto del <name>.
+
+espacios_regex = re.compile(rb'\s*')
+
+
+class RegistroPlacemark:
+    """
+    Datos mínimos de un Placemark. No guarda la geometría ni la descripción:
+    solo el rango de bytes del Placemark original, que se copia sin tocar al escribir.
+    """
+    __slots__ = ('inicio', 'fin', 'fin_apertura', 'nombre_inicio', 'nombre_fin',
+                 'nombre', 'placemark_id', 'datos', 'nombre_nuevo', 'clave')
+
+    def __init__(self, inicio, fin, fin_apertura, nombre_inicio, nombre_fin, nombre, placemark_id, datos):
+        self.inicio = inicio                # rango completo del Placemark en el archivo
+        self.fin = fin
+        self.fin_apertura = fin_apertura    # fin de la etiqueta de apertura (para insertar <name>)
+        self.nombre_inicio = nombre_inicio  # rango del texto de <name>, -1 si no tiene
+        self.nombre_fin = nombre_fin
+        self.nombre = nombre
+        self.placemark_id = placemark_id
+        self.datos = datos                  # tupla de pares (campo, valor) con cadenas internadas
+        self.nombre_nuevo = None
+        self.clave = None
+
+    def datos_dict(self):
+        return dict(self.datos)
+
+    def valor(self, campo):
+        """Valor de un SimpleData del Placemark, o None si no lo tiene."""
+        for nombre, valor in self.datos:
+            if nombre == campo:
+                return valor
+        return None
+
+
+def leer_registros(contenido, inicio=0, fin=None):
+    """
+    Busca los Placemarks entre 'inicio' y 'fin' del contenido (bytes o mmap) y devuelve sus registros.
+    """
+    if fin is None:
+        fin = len(contenido)
+
+    registros = []
+    for match, placemark_id, name_match, datos in escanear_placemarks(contenido, inicio, fin):
+        p_inicio, p_fin = match.span()
+        fin_apertura = p_inicio + match.group(0).index(b'>') + 1
+
+        nombre = None
+        nombre_inicio = nombre_fin = -1
+        if name_match:
+            nombre = desescapar(name_match.group(2)).strip()
+            nombre_inicio = p_inicio + name_match.start(2)
+            nombre_fin = p_inicio + name_match.end(2)
+
+        # Los nombres de campo y los valores se repiten mucho entre Placemarks: se internan
+        datos = tuple(
+            (sys.intern(campo), sys.intern(valor) if valor is not None else None)
+            for campo, valor in datos
+        )
+        registros.append(RegistroPlacemark(p_inicio, p_fin, fin_apertura, nombre_inicio, nombre_fin,
+                                           nombre, sys.intern(placemark_id) if placemark_id else None, datos))
+    return registros
+
+
+def aplicar_regla(registros, regla):
+    """Calcula nombre nuevo y clave de orden de cada registro con una regla de reglas_capas.py."""
+    for registro in registros:
+        registro.nombre_nuevo, registro.clave = regla(registro.nombre, registro.placemark_id, registro.datos_dict())
+
+
+def ordenar_registros(registros, campos_orden=()):
+    """
+    Ordena los registros por los campos de SimpleData pedidos (en orden natural) y, al final,
+    por la clave de la regla. Las claves se calculan una sola vez por registro.
+
+    Args:
+        registros (list): Registros con la clave de la regla ya calculada.
+        campos_orden (iterable): Campos de SimpleData, del más al menos significativo (ej. ['uso']).
+
+    Returns:
+        list: Registros ordenados.
+    """
+    claves_por_campo = [[clave_natural(registro.valor(campo)) for registro in registros] for campo in campos_orden]
+    claves_por_campo.append([registro.clave for registro in registros])
+    return [registros[i] for i in permutacion(claves_por_campo)]
+
+
+def bytes_placemark(contenido, registro):
+    """Bytes del Placemark original con el <name> reemplazado (o agregado) si la regla lo cambió."""
+    if registro.nombre_nuevo is None or registro.nombre_nuevo == registro.nombre:
+        return contenido[registro.inicio:registro.fin]
+    nombre = escape(registro.nombre_nuevo).encode('utf-8')
+    if registro.nombre_inicio >= 0:
+        return (contenido[registro.inicio:registro.nombre_inicio] + nombre
+                + contenido[registro.nombre_fin:registro.fin])
+    # Sin <name>: se inserta como primer hijo, con la misma sangría que el elemento siguiente
+    prefijo = placemark_regex.match(contenido, registro.inicio, registro.fin).group(1)
+    sangria = espacios_regex.match(contenido, registro.fin_apertura).group(0) or b'\n'
+    return (contenido[registro.inicio:registro.fin_apertura] + sangria
+            + b'<' + prefijo + b'name>' + nombre + b'</' + prefijo + b'name>'
+            + contenido[registro.fin_apertura:registro.fin])
+
+
+def escribir(contenido, registros, output_kml_path, ordenar):
+    """
+    Escribe el KML de salida copiando los bytes originales. Con 'ordenar', los Placemarks
+    (todos contiguos dentro de la carpeta) se escriben en el orden de los registros; lo que no
+    sea Placemark entre ellos se mantiene antes del bloque ordenado, igual que al hacer remove/append.
+    """
+    with open(output_kml_path, 'wb') as salida:
+        if not ordenar:
+            posicion = 0
+            for registro in registros:
+                salida.write(contenido[posicion:registro.inicio])
+                salida.write(bytes_placemark(contenido, registro))
+                posicion = registro.fin
+            salida.write(contenido[posicion:])
+            return
+
+        por_posicion = sorted(registros, key=attrgetter('inicio'))
+        primero, ultimo = por_posicion[0], por_posicion[-1]
+        separador = b'\n'
+        if len(por_posicion) > 1:
+            separador = contenido[primero.fin:por_posicion[1].inicio]
+            if separador.strip():
+                separador = b'\n'
+
+        salida.write(contenido[:primero.inicio])
+        for anterior, siguiente in zip(por_posicion, por_posicion[1:]):
+            intermedio = contenido[anterior.fin:siguiente.inicio]
+            if intermedio.strip():
+                salida.write(intermedio.strip() + separador)
+        for i, registro in enumerate(registros):
+            if i:
+                salida.write(separador)
+            salida.write(bytes_placemark(contenido, registro))
+        salida.write(contenido[ultimo.fin:])
+
+
+def procesar_capa(input_kml_path, output_kml_path, regla, ordenar=True, campos_orden=()):
+    """
+    Aplica una regla de nombre (y orden) a los Placemarks de un KML sin construir el árbol XML.
+
+    Args:
+        input_kml_path (str): Ruta al archivo KML de entrada.
+        output_kml_path (str): Ruta donde se guardará el archivo KML modificado.
+        regla (callable): Regla de reglas_capas.REGLAS.
+        ordenar (bool): Si es True, ordena los Placemarks de la primera <Folder> por la clave de la regla.
+            Si es False, solo cambia los nombres de todos los Placemarks del documento.
+        campos_orden (iterable): Campos de SimpleData por los que se ordena antes que por la clave de la regla
+            (ej. ['uso'] agrupa por uso). Solo se usa con 'ordenar'.
+
+    Returns:
+        list: Registros en el orden en que quedaron escritos (vacía si no hay Placemarks, y en ese caso
+            no se escribe el archivo de salida).
+    """
+    if os.path.getsize(input_kml_path) == 0:
+        return []
+
+    with open(input_kml_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as contenido:
+        if ordenar:
+            registros = leer_registros(contenido, *rango_primera_carpeta(contenido))
+        else:
+            registros = leer_registros(contenido)
+        if not registros:
+            return []
+
+        aplicar_regla(registros, regla)
+        if ordenar:
+            registros = ordenar_registros(registros, campos_orden)
+        escribir(contenido, registros, output_kml_path, ordenar)
+    return registros
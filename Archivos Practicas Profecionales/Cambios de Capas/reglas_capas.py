@@ -0,0 +1,113 @@
+import re
+
+# Reglas de nombre y orden de cada capa, las mismas que aplican los scripts modificar_kml*.py y sup.py.
+# Cada regla recibe (nombre actual, id del Placemark, dict de SimpleData) y devuelve
+# (nombre nuevo o None si no se cambia, clave de ordenamiento).
+# Las claves son tuplas (0, números...) o (1, texto), así los números van antes que los textos
+# y nunca se comparan enteros con cadenas.
+
+from parser_kml import KML_NS
+
+# Expresión regular para encontrar el número en el nombre del punto (ej. "P - 1" -> 1)
+name_number_regex = re.compile(r'P - (\d+)')
+# Expresión regular para encontrar los dos números en "XXXX YYYY" de ccpp1
+ccpp1_numbers_regex = re.compile(r'(\d+)\s+(\d+)')
+
+
+def regla_pozos_monitoreo(nombre, placemark_id, datos):
+    """
+    Pozos Medidos / Pozos Medidos Con Exito: no modifica el nombre y ordena
+    por el número presente en él (ej. 'P - 1', 'P - 10').
+    """
+    if nombre:
+        match = name_number_regex.search(nombre)
+        if match:
+            return None, (0, int(match.group(1)))
+        return None, (1, nombre)
+    return None, (1, placemark_id or 'Sin Nombre')
+
+
+def regla_pozos_san_rafael(nombre, placemark_id, datos):
+    """
+    Pozos San Rafael: el nombre es el valor de 'dp_pozo' sin el prefijo de departamento '17 '
+    y se ordena numéricamente por ese valor.
+    """
+    pozo_number_raw = (datos.get('dp_pozo') or '').strip()
+    if not pozo_number_raw:
+        return None, (1, placemark_id or '0')
+
+    if pozo_number_raw.startswith('17 '):
+        pozo_number_clean = pozo_number_raw[3:]
+    else:
+        pozo_number_clean = pozo_number_raw
+
+    try:
+        return pozo_number_clean, (0, int(pozo_number_clean))
+    except ValueError:
+        return pozo_number_clean, (1, pozo_number_clean)
+
+
+def regla_pozos_san_rafael_con_depto(nombre, placemark_id, datos):
+    """
+    Pozos San Rafael (solo nombres): el nombre es el valor completo de 'dp_pozo', sin quitar el departamento.
+    No se usa para ordenar; la clave solo mantiene el formato común.
+    """
+    pozo_number = (datos.get('dp_pozo') or '').strip()
+    if not pozo_number:
+        return None, (1, placemark_id or '0')
+    return pozo_number, (1, pozo_number)
+
+
+def regla_superficial(nombre, placemark_id, datos):
+    """
+    Padrones de Código Superficial: el nombre es el valor de 'ccpp1' ("XXXX YYYY")
+    y se ordena por el primer número y luego por el segundo.
+    """
+    ccpp1_text = (datos.get('ccpp1') or '').strip()
+    if not ccpp1_text:
+        extracted_name = placemark_id or 'Sin Nombre'
+        return extracted_name, (1, extracted_name)
+
+    match = ccpp1_numbers_regex.search(ccpp1_text)
+    if match:
+        first_num_str, second_num_str = match.group(1), match.group(2)
+        return f"{first_num_str} {second_num_str}", (0, int(first_num_str), int(second_num_str))
+    return ccpp1_text, (1, ccpp1_text)
+
+
+REGLAS = {
+    'pozos_monitoreo': regla_pozos_monitoreo,
+    'pozos_san_rafael': regla_pozos_san_rafael,
+    'pozos_san_rafael_con_depto': regla_pozos_san_rafael_con_depto,
+    'superficial': regla_superficial,
+}
+
+
+def aplicar_regla(regla, placemark):
+    """
+    Aplica una regla a un Placemark leído con parser_kml: actualiza (o crea) su <name>
+    y devuelve la clave de ordenamiento.
+
+    Args:
+        regla (callable): Una de las funciones de REGLAS.
+        placemark (Element): Elemento <Placemark>.
+
+    Returns:
+        tuple: Clave de ordenamiento del Placemark.
+    """
+    name_element = placemark.find(KML_NS + 'name')
+    nombre = name_element.text.strip() if name_element is not None and name_element.text else None
+    datos = {
+        simple_data.get('name'): simple_data.text
+        for simple_data in placemark.iterfind(f'{KML_NS}ExtendedData/{KML_NS}SchemaData/{KML_NS}SimpleData')
+    }
+
+    nuevo_nombre, clave = regla(nombre, placemark.get('id'), datos)
+    if nuevo_nombre is not None:
+        if name_element is not None:
+            name_element.text = nuevo_nombre
+        else:
+            new_name_element = placemark.makeelement(KML_NS + 'name', {})
+            new_name_element.text = nuevo_nombre
+            placemark.insert(0, new_name_element)
+    return clave
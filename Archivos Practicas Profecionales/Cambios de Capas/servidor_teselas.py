@@ -0,0 +1,384 @@
+import os
+import sys
+import sqlite3
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs, quote, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from xml.sax.saxutils import escape
+
+from parser_kml import KML_NS, abrir_kml, iterparse, serializar, declaraciones_raiz, ErroresParseo, backend
+from fusionar_capas import es_href_local
+from reglas_capas import REGLAS, aplicar_regla
+from orden_natural import permutacion
+
+TIPO_KML = 'application/vnd.google-earth.kml+xml; charset=utf-8'
+
+# Los bounding boxes se redondean hacia afuera a esta grilla (en grados) para que
+# vistas casi iguales compartan la misma tesela en la caché
+TAMANO_GRILLA = 0.01
+
+def extension_geografica(placemark):
+    """Devuelve (min_lon, max_lon, min_lat, max_lat) de todas las <coordinates> del Placemark, o None."""
+    min_lon = min_lat = float('inf')
+    max_lon = max_lat = float('-inf')
+    for coordenadas in placemark.iter(KML_NS + 'coordinates'):
+        for tupla in (coordenadas.text or '').split():
+            valores = tupla.split(',')
+            if len(valores) < 2:
+                continue
+            lon, lat = float(valores[0]), float(valores[1])
+            min_lon, max_lon = min(min_lon, lon), max(max_lon, lon)
+            min_lat, max_lat = min(min_lat, lat), max(max_lat, lat)
+    if min_lon == float('inf'):
+        return None
+    return min_lon, max_lon, min_lat, max_lat
+
+
+def crear_tablas(con):
+    con.executescript("""
+        CREATE TABLE capas (
+            capa TEXT PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            estilos TEXT NOT NULL,
+            cantidad INTEGER NOT NULL
+        );
+        CREATE TABLE placemarks (
+            id INTEGER PRIMARY KEY,
+            capa TEXT NOT NULL,
+            orden INTEGER,
+            kml TEXT NOT NULL
+        );
+        CREATE VIRTUAL TABLE indice USING rtree (id, min_lon, max_lon, min_lat, max_lat);
+        CREATE TABLE iconos (
+            ruta TEXT PRIMARY KEY,
+            datos BLOB NOT NULL
+        );
+    """)
+
+
+def indexar_capa(con, capa, kml_path, regla, proximo_id):
+    """
+    Lee una capa en streaming, aplica su regla de nombre y orden y guarda cada Placemark
+    serializado junto con su extensión en el índice espacial (R*Tree de SQLite).
+
+    Returns:
+        int: Próximo id libre.
+    """
+    estilos = []
+    claves = []
+    filas = []
+    rectangulos = []
+    nombre_capa = None
+    pila = []
+
+    kml_file, leer_auxiliar = abrir_kml(kml_path)
+    with kml_file:
+        for evento, elem in iterparse(kml_file, ('start', 'end')):
+            if evento == 'start':
+                pila.append(elem)
+                continue
+            pila.pop()
+            padre = pila[-1] if pila else None
+            if padre is None:
+                continue
+
+            if elem.tag in (KML_NS + 'Style', KML_NS + 'StyleMap', KML_NS + 'Schema') and padre.tag != KML_NS + 'Placemark':
+                # Los íconos locales se sirven desde /iconos/<capa>/...
+                for href_elem in elem.iter(KML_NS + 'href'):
+                    href = (href_elem.text or '').strip()
+                    if es_href_local(href):
+                        datos = leer_auxiliar(href)
+                        if datos is not None:
+                            ruta = f"{capa}/{href}"
+                            con.execute('INSERT OR REPLACE INTO iconos (ruta, datos) VALUES (?, ?)', (ruta, datos))
+                            href_elem.text = '../iconos/' + quote(ruta)
+                estilos.append(serializar(elem))
+                padre.remove(elem)
+            elif elem.tag == KML_NS + 'name' and padre.tag == KML_NS + 'Folder' and nombre_capa is None:
+                nombre_capa = (elem.text or '').strip()
+            elif elem.tag == KML_NS + 'Placemark':
+                extension = extension_geografica(elem)
+                if extension is not None:
+                    claves.append((aplicar_regla(regla, elem), proximo_id))
+                    filas.append((proximo_id, capa, serializar(elem)))
+                    rectangulos.append((proximo_id,) + extension)
+                    proximo_id += 1
+                padre.remove(elem)
+
+                if len(filas) >= 1000:
+                    con.executemany('INSERT INTO placemarks (id, capa, kml) VALUES (?, ?, ?)', filas)
+                    con.executemany('INSERT INTO indice VALUES (?, ?, ?, ?, ?)', rectangulos)
+                    filas.clear()
+                    rectangulos.clear()
+
+    con.executemany('INSERT INTO placemarks (id, capa, kml) VALUES (?, ?, ?)', filas)
+    con.executemany('INSERT INTO indice VALUES (?, ?, ?, ?, ?)', rectangulos)
+
+    # El orden se calcula una sola vez al construir el índice: las teselas solo hacen ORDER BY orden
+    orden = permutacion([[clave for clave, _ in claves]])
+    con.executemany('UPDATE placemarks SET orden = ? WHERE id = ?',
+                    [(posicion, claves[i][1]) for posicion, i in enumerate(orden)])
+    con.execute('INSERT INTO capas (capa, nombre, estilos, cantidad) VALUES (?, ?, ?, ?)',
+                (capa, nombre_capa or capa, '\n'.join(estilos), len(claves)))
+    print(f"  {nombre_capa or capa}: {len(claves)} Placemarks indexados")
+    return proximo_id
+
+
+def construir_indice(capas, db_path):
+    """
+    Construye el almacén indexado a partir de las capas. Se genera en un archivo temporal
+    y se reemplaza al final, así el servidor nunca ve un índice a medio construir.
+
+    Args:
+        capas (list): Tuplas (identificador, ruta KML/KMZ, nombre de la regla en REGLAS).
+        db_path (str): Ruta del archivo SQLite.
+    """
+    temporal_path = db_path + '.tmp'
+    if os.path.exists(temporal_path):
+        os.remove(temporal_path)
+    con = sqlite3.connect(temporal_path)
+    try:
+        crear_tablas(con)
+        proximo_id = 1
+        with con:
+            for capa, kml_path, nombre_regla in capas:
+                proximo_id = indexar_capa(con, capa, kml_path, REGLAS[nombre_regla], proximo_id)
+        con.execute('CREATE INDEX idx_placemarks_orden ON placemarks (capa, orden)')
+        con.commit()
+    finally:
+        con.close()
+    os.replace(temporal_path, db_path)
+
+
+def indice_desactualizado(capas, db_path):
+    """El índice se reconstruye si no existe o si alguna capa es más nueva que él."""
+    if not os.path.exists(db_path):
+        return True
+    fecha_indice = os.path.getmtime(db_path)
+    return any(os.path.getmtime(kml_path) > fecha_indice for _, kml_path, _ in capas)
+
+
+def ajustar_a_grilla(oeste, sur, este, norte):
+    """Redondea el bounding box hacia afuera a la grilla de TAMANO_GRILLA grados."""
+    def abajo(valor):
+        return round((valor // TAMANO_GRILLA) * TAMANO_GRILLA, 6)
+
+    def arriba(valor):
+        return round(-((-valor) // TAMANO_GRILLA) * TAMANO_GRILLA, 6)
+    return abajo(oeste), abajo(sur), arriba(este), arriba(norte)
+
+
+class CacheTeselas:
+    """
+    Caché LRU de teselas limitada por bytes (no por cantidad: una tesela amplia de Superficial pesa
+    varios MB y una de pozos unos pocos KB). Las teselas más grandes que 'maximo_tesela' no se guardan.
+    """
+
+    def __init__(self, maximo_bytes, maximo_tesela):
+        self.maximo_bytes = maximo_bytes
+        self.maximo_tesela = maximo_tesela
+        self.bytes = 0
+        self._teselas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            tesela = self._teselas.get(clave)
+            if tesela is not None:
+                self._teselas.move_to_end(clave)
+            return tesela
+
+    def guardar(self, clave, tesela):
+        if len(tesela) > self.maximo_tesela:
+            return
+        with self._lock:
+            anterior = self._teselas.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= len(anterior)
+            self._teselas[clave] = tesela
+            self.bytes += len(tesela)
+            while self.bytes > self.maximo_bytes:
+                _, descartada = self._teselas.popitem(last=False)
+                self.bytes -= len(descartada)
+
+
+class AlmacenTeselas:
+    """
+    Responde consultas por bounding box sobre el índice. Cada hilo del servidor usa su propia
+    conexión SQLite y delante del índice hay una caché LRU de teselas ya renderizadas.
+    """
+
+    def __init__(self, db_path, cache_mb=64, limite_placemarks=5000):
+        self.db_path = db_path
+        self.limite_placemarks = limite_placemarks
+        self._local = threading.local()
+        # Ninguna tesela ocupa más de un octavo de la caché, así una vista amplia no la vacía entera
+        self.cache = CacheTeselas(cache_mb * 1024 * 1024, cache_mb * 1024 * 1024 // 8)
+        con = self._conexion()
+        self.capas = {capa: nombre for capa, nombre in con.execute('SELECT capa, nombre FROM capas ORDER BY rowid')}
+
+    def _conexion(self):
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            con = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True)
+            self._local.con = con
+        return con
+
+    def renderizar_tesela(self, capa, oeste, sur, este, norte):
+        con = self._conexion()
+        nombre, estilos = con.execute('SELECT nombre, estilos FROM capas WHERE capa = ?', (capa,)).fetchone()
+        # Se pide uno más que el límite para saber si la tesela quedó recortada
+        placemarks = con.execute(
+            "SELECT p.kml FROM indice i JOIN placemarks p ON p.id = i.id "
+            "WHERE i.max_lon >= ? AND i.min_lon <= ? AND i.max_lat >= ? AND i.min_lat <= ? AND p.capa = ? "
+            "ORDER BY p.orden LIMIT ?",
+            (oeste, este, sur, norte, capa, self.limite_placemarks + 1),
+        ).fetchall()
+
+        nombre_carpeta = escape(nombre)
+        aviso = ''
+        if len(placemarks) > self.limite_placemarks:
+            placemarks = placemarks[:self.limite_placemarks]
+            total, = con.execute(
+                "SELECT COUNT(*) FROM indice i JOIN placemarks p ON p.id = i.id "
+                "WHERE i.max_lon >= ? AND i.min_lon <= ? AND i.max_lat >= ? AND i.min_lat <= ? AND p.capa = ?",
+                (oeste, este, sur, norte, capa),
+            ).fetchone()
+            # Aviso visible en el panel Lugares de Google Earth: la vista tiene más elementos de los que se envían
+            texto = f"Se muestran {self.limite_placemarks} de {total} elementos. Acercá la vista para ver todos."
+            nombre_carpeta += escape(f" ({self.limite_placemarks} de {total}, acercá la vista)")
+            aviso = f'\t\t<Snippet maxLines="2">{escape(texto)}</Snippet>\n\t\t<description>{escape(texto)}</description>\n'
+
+        partes = [documento_kml_inicio(nombre), estilos, f'\n\t<Folder>\n\t\t<name>{nombre_carpeta}</name>\n', aviso]
+        partes.extend('\t\t' + kml + '\n' for (kml,) in placemarks)
+        partes.append('\t</Folder>\n</Document>\n</kml>\n')
+        return ''.join(partes).encode('utf-8')
+
+    def tesela(self, capa, oeste, sur, este, norte):
+        clave = (capa,) + ajustar_a_grilla(oeste, sur, este, norte)
+        tesela = self.cache.obtener(clave)
+        if tesela is None:
+            tesela = self.renderizar_tesela(*clave)
+            self.cache.guardar(clave, tesela)
+        return tesela
+
+    def icono(self, ruta):
+        fila = self._conexion().execute('SELECT datos FROM iconos WHERE ruta = ?', (ruta,)).fetchone()
+        return fila[0] if fila else None
+
+
+def documento_kml_inicio(nombre):
+    return (f'<?xml version="1.0" encoding="UTF-8"?>\n<kml {declaraciones_raiz()}>\n<Document>\n'
+            f'\t<name>{escape(nombre)}</name>\n')
+
+
+def documento_raiz(almacen, url_base):
+    """KML de entrada: un NetworkLink por capa que se refresca con la vista (viewRefreshMode=onStop)."""
+    partes = [documento_kml_inicio('Capas Irrigación (servidor local)')]
+    for capa, nombre in almacen.capas.items():
+        partes.append(
+            f'\t<NetworkLink>\n'
+            f'\t\t<name>{escape(nombre)}</name>\n'
+            f'\t\t<Link>\n'
+            f'\t\t\t<href>{escape(url_base)}/capas/{quote(capa)}.kml</href>\n'
+            f'\t\t\t<viewRefreshMode>onStop</viewRefreshMode>\n'
+            f'\t\t\t<viewRefreshTime>1</viewRefreshTime>\n'
+            f'\t\t\t<viewFormat>BBOX=[bboxWest],[bboxSouth],[bboxEast],[bboxNorth]</viewFormat>\n'
+            f'\t\t</Link>\n'
+            f'\t</NetworkLink>\n'
+        )
+    partes.append('</Document>\n</kml>\n')
+    return ''.join(partes).encode('utf-8')
+
+
+class ManejadorTeselas(BaseHTTPRequestHandler):
+    """Rutas: '/' (NetworkLinks), '/capas/<capa>.kml?BBOX=o,s,e,n' (tesela) e '/iconos/<ruta>'."""
+
+    def _responder(self, codigo, cuerpo, tipo=TIPO_KML):
+        self.send_response(codigo)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        almacen = self.server.almacen
+        url = urlsplit(self.path)
+
+        if url.path in ('/', '/capas.kml'):
+            host = self.headers.get('Host') or f'{self.server.server_address[0]}:{self.server.server_address[1]}'
+            self._responder(200, documento_raiz(almacen, f'http://{host}'))
+            return
+
+        if url.path.startswith('/iconos/'):
+            datos = almacen.icono(unquote(url.path[len('/iconos/'):]))
+            if datos is None:
+                self._responder(404, b'No encontrado', 'text/plain; charset=utf-8')
+            else:
+                self._responder(200, datos, 'image/png' if url.path.lower().endswith('.png') else 'application/octet-stream')
+            return
+
+        if url.path.startswith('/capas/') and url.path.endswith('.kml'):
+            capa = unquote(url.path[len('/capas/'):-len('.kml')])
+            if capa not in almacen.capas:
+                self._responder(404, b'Capa inexistente', 'text/plain; charset=utf-8')
+                return
+            try:
+                oeste, sur, este, norte = (float(v) for v in parse_qs(url.query)['BBOX'][0].split(','))
+            except (KeyError, ValueError):
+                self._responder(400, b'Falta el parametro BBOX=oeste,sur,este,norte', 'text/plain; charset=utf-8')
+                return
+            self._responder(200, almacen.tesela(capa, oeste, sur, este, norte))
+            return
+
+        self._responder(404, b'No encontrado', 'text/plain; charset=utf-8')
+
+
+def servir(db_path, host, puerto, cache_mb=64):
+    almacen = AlmacenTeselas(db_path, cache_mb=cache_mb)
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorTeselas)
+    servidor.almacen = almacen
+    print(f"Servidor de teselas escuchando en http://{host}:{puerto}/")
+    print("En Google Earth: Agregar > Enlace de red, con esa dirección.")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServidor detenido.")
+    finally:
+        servidor.server_close()
+
+
+# --- Configuración ---
+# Capas que se indexan: (identificador en la URL, ruta relativa a 'Cambios de Capas', regla de reglas_capas.py).
+# Las reglas aplican el mismo nombre y orden que los scripts de cada carpeta.
+capas_config = [
+    ('pozos_san_rafael', 'Pozos San Rafael/doc.kml', 'pozos_san_rafael'),
+    ('pozos_medidos', 'Pozos Medidos/doc.kml', 'pozos_monitoreo'),
+    ('pozos_medidos_con_exito', 'Pozos Medidos Con Exito/doc.kml', 'pozos_monitoreo'),
+    ('superficial', 'Superficial/Padriones De Codigo Superficial.zip', 'superficial'),
+]
+db_file = 'indice_teselas.db'
+host = '127.0.0.1'
+puerto = 8765
+
+# --- Ejecutar la función ---
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    capas = [(capa, os.path.join(base_dir, ruta), regla) for capa, ruta, regla in capas_config]
+    faltantes = [ruta for _, ruta, _ in capas if not os.path.exists(ruta)]
+    if faltantes:
+        for ruta in faltantes:
+            print(f"Error: La capa '{ruta}' no existe.")
+        sys.exit(1)
+
+    db_path = os.path.join(base_dir, db_file)
+    try:
+        if indice_desactualizado(capas, db_path):
+            print(f"Construyendo el índice espacial de las capas (parser: {backend.nombre})...")
+            construir_indice(capas, db_path)
+        servir(db_path, host, puerto)
+    except ErroresParseo as e:
+        print(f"Error al parsear el archivo KML: {e}. Asegúrate de que es un XML válido.")
+    except OSError as e:
+        print(f"Error: {e}")
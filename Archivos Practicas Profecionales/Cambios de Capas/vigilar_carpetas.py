@@ -0,0 +1,349 @@
+import os
+import sys
+import time
+import signal
+import shutil
+import fnmatch
+import zipfile
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from reglas_capas import REGLAS
+from registros_kml import procesar_capa
+from exportar_geojson import exportar_geojson
+from parser_kml import abrir_kml
+
+# watchdog es opcional: usa las notificaciones del sistema operativo (inotify, ReadDirectoryChangesW, FSEvents)
+# y el vigilante no hace nada mientras no haya cambios. Sin watchdog se revisan las carpetas cada
+# 'intervalo_sondeo' segundos, que también es casi gratis (solo un listado de cada carpeta).
+try:
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+# Extensiones de las exportaciones que se procesan. Los temporales (.tmp, .crdownload, .part)
+# y las salidas de cada carpeta se ignoran, así lo que escribe el vigilante no lo vuelve a disparar.
+EXTENSIONES_ENTRADA = ('.kml', '.kmz', '.zip')
+# Máximo de segundos que el bucle principal espera sin despertarse (para poder atender Ctrl+C)
+ESPERA_MAXIMA = 1.0
+
+
+def firma(ruta):
+    """(tamaño, fecha de modificación) del archivo, o None si ya no existe."""
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    return estado.st_size, estado.st_mtime_ns
+
+
+def archivo_completo(ruta):
+    """
+    Comprueba que una descarga terminó de escribirse: un zip/kmz necesita su directorio central
+    (lo último que se escribe) y un KML tiene que terminar en </kml>.
+    """
+    if not ruta.lower().endswith('.kml'):
+        return zipfile.is_zipfile(ruta)
+    with open(ruta, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - 256, 0))
+        return f.read().rstrip().endswith(b'kml>')
+
+
+def ignorar_interrupcion():
+    """Los procesos del pool ignoran Ctrl+C: el vigilante es quien los detiene al salir."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def procesar_exportacion(entrada, tareas):
+    """
+    Aplica las tareas de una carpeta a una exportación nueva. Se ejecuta en un proceso del pool.
+    Cada salida se escribe en un temporal y se reemplaza con os.replace, así quien lea la capa
+    (Google Earth, fusionar_capas.py, servidor_teselas.py) nunca ve un archivo a medio escribir.
+
+    Args:
+        entrada (str): Ruta al .kml, .kmz o .zip exportado.
+        tareas (list): Tuplas (regla, ordenar, salida KML, salida GeoJSON o None) de la carpeta.
+
+    Returns:
+        list: Tuplas (salida KML, cantidad de Placemarks) de cada tarea.
+    """
+    carpeta = os.path.dirname(entrada)
+    temporales = []
+    try:
+        kml_path = entrada
+        if not entrada.lower().endswith('.kml'):
+            # procesar_capa mapea el archivo en memoria: el doc.kml del kmz/zip se extrae a un temporal
+            kml_file, _ = abrir_kml(entrada)
+            fd, kml_path = tempfile.mkstemp(dir=carpeta, suffix='.kml.tmp')
+            temporales.append(kml_path)
+            with kml_file, os.fdopen(fd, 'wb') as destino:
+                shutil.copyfileobj(kml_file, destino, 1 << 20)
+
+        resultados = []
+        for regla, ordenar, salida_kml, salida_geojson in tareas:
+            salida_kml_path = os.path.join(carpeta, salida_kml)
+            temporal = salida_kml_path + '.tmp'
+            temporales.append(temporal)
+            registros = procesar_capa(kml_path, temporal, REGLAS[regla], ordenar)
+            resultados.append((salida_kml, len(registros)))
+            if not registros:
+                continue
+            os.replace(temporal, salida_kml_path)
+
+            if salida_geojson:
+                salida_geojson_path = os.path.join(carpeta, salida_geojson)
+                temporal = salida_geojson_path + '.tmp'
+                temporales.append(temporal)
+                if exportar_geojson(salida_kml_path, temporal):
+                    os.replace(temporal, salida_geojson_path)
+        return resultados
+    finally:
+        for temporal in temporales:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+
+class ManejadorEventos:
+    """Recibe los eventos de watchdog (el observador solo llama a dispatch) y se los pasa al vigilante."""
+
+    def __init__(self, vigilante):
+        self.vigilante = vigilante
+
+    def dispatch(self, event):
+        # Solo interesan las escrituras: abrir o leer un archivo (ej. al copiarlo) también genera eventos
+        if event.is_directory or event.event_type not in ('created', 'modified', 'moved', 'closed'):
+            return
+        # Los navegadores descargan a un temporal y al terminar lo renombran: interesa el destino
+        ruta = getattr(event, 'dest_path', None) or event.src_path
+        if isinstance(ruta, bytes):
+            ruta = os.fsdecode(ruta)
+        self.vigilante.notificar(ruta)
+
+
+class VigilanteCarpetas:
+    """
+    Vigila las carpetas de las capas y procesa cada exportación nueva o modificada con la regla de su carpeta.
+    Un archivo se procesa recién cuando deja de cambiar durante 'espera' segundos y está completo;
+    nunca hay dos trabajos a la vez sobre la misma carpeta porque comparten los archivos de salida.
+    """
+
+    def __init__(self, carpetas, trabajadores=2, espera=2.0, intervalo_sondeo=5.0):
+        """
+        Args:
+            carpetas (dict): {ruta de la carpeta: (patrones de entrada, tareas)}.
+            trabajadores (int): Procesos del pool (máximo de capas procesándose a la vez).
+            espera (float): Segundos sin cambios que tiene que pasar un archivo antes de procesarlo.
+            intervalo_sondeo (float): Segundos entre revisiones de las carpetas si watchdog no está instalado.
+        """
+        self.carpetas = {os.path.abspath(carpeta): config for carpeta, config in carpetas.items()}
+        self.trabajadores = trabajadores
+        self.espera = espera
+        self.intervalo_sondeo = intervalo_sondeo
+        # Nombres que escribe el propio vigilante en cada carpeta
+        self.salidas = {
+            carpeta: {nombre for tarea in tareas for nombre in tarea[2:] if nombre}
+            for carpeta, (_, tareas) in self.carpetas.items()
+        }
+        self.condicion = threading.Condition()
+        self.detenido = threading.Event()
+        self.pendientes = {}    # ruta -> (instante en que se vuelve a revisar, firma vista la vez anterior)
+        self.procesadas = {}    # ruta -> firma con la que se procesó por última vez
+        self.en_proceso = set()  # carpetas con un trabajo en curso
+        self.executor = None
+
+    def es_entrada(self, ruta):
+        """True si la ruta es una exportación de alguna de las carpetas vigiladas."""
+        carpeta, nombre = os.path.split(os.path.abspath(ruta))
+        if carpeta not in self.carpetas or nombre in self.salidas[carpeta]:
+            return False
+        if nombre.startswith(('.', '~')) or not nombre.lower().endswith(EXTENSIONES_ENTRADA):
+            return False
+        patrones, _ = self.carpetas[carpeta]
+        return any(fnmatch.fnmatch(nombre, patron) for patron in patrones)
+
+    def entradas(self, carpeta):
+        """Rutas de las exportaciones que hay ahora en una carpeta vigilada."""
+        try:
+            with os.scandir(carpeta) as archivos:
+                return [archivo.path for archivo in archivos if archivo.is_file() and self.es_entrada(archivo.path)]
+        except FileNotFoundError:
+            return []
+
+    def notificar(self, ruta):
+        """Registra un cambio en una ruta; se revisa cuando pasen 'espera' segundos sin más cambios."""
+        if not self.es_entrada(ruta):
+            return
+        ruta = os.path.abspath(ruta)
+        with self.condicion:
+            self.pendientes[ruta] = (time.monotonic() + self.espera, firma(ruta))
+            self.condicion.notify()
+
+    def pendientes_al_iniciar(self):
+        """Encola, por carpeta, la exportación más reciente si es más nueva que alguna de sus salidas."""
+        for carpeta, (_, tareas) in self.carpetas.items():
+            entradas = self.entradas(carpeta)
+            if not entradas:
+                continue
+            mas_reciente = max(entradas, key=os.path.getmtime)
+            salidas = [os.path.join(carpeta, nombre) for nombre in self.salidas[carpeta]]
+            fecha_salidas = min((os.path.getmtime(s) if os.path.exists(s) else -1 for s in salidas), default=-1)
+            if os.path.getmtime(mas_reciente) > fecha_salidas:
+                self.notificar(mas_reciente)
+
+    def sondear(self):
+        """Alternativa sin watchdog: compara las firmas de los archivos de cada carpeta cada 'intervalo_sondeo'."""
+        anteriores = {ruta: firma(ruta) for carpeta in self.carpetas for ruta in self.entradas(carpeta)}
+        while not self.detenido.wait(self.intervalo_sondeo):
+            actuales = {ruta: firma(ruta) for carpeta in self.carpetas for ruta in self.entradas(carpeta)}
+            for ruta, firma_actual in actuales.items():
+                if anteriores.get(ruta) != firma_actual:
+                    self.notificar(ruta)
+            anteriores = actuales
+
+    def revisar(self, ruta, ahora):
+        """Decide si un archivo pendiente ya se puede procesar. Se llama con la condición tomada."""
+        _, firma_anterior = self.pendientes[ruta]
+        firma_actual = firma(ruta)
+        if firma_actual is None:
+            # Se borró o se renombró (el destino llega como otro evento)
+            del self.pendientes[ruta]
+            return
+        carpeta = os.path.dirname(ruta)
+        if firma_actual != firma_anterior or carpeta in self.en_proceso:
+            # Todavía se está escribiendo (o la carpeta está ocupada): se vuelve a mirar más tarde
+            self.pendientes[ruta] = (ahora + self.espera, firma_actual)
+            return
+        del self.pendientes[ruta]
+        if self.procesadas.get(ruta) == firma_actual:
+            return
+        if not archivo_completo(ruta):
+            print(f"Advertencia: '{ruta}' está incompleto o no es válido. Se procesará cuando vuelva a cambiar.")
+            return
+
+        _, tareas = self.carpetas[carpeta]
+        print(f"[{time.strftime('%H:%M:%S')}] Procesando '{ruta}'...")
+        try:
+            futuro = self.executor.submit(procesar_exportacion, ruta, tareas)
+        except BrokenProcessPool:
+            # Un proceso del pool terminó de golpe (ej. sin memoria): el pool ya no acepta trabajos
+            print("Advertencia: Un proceso de trabajo terminó de forma inesperada. Se vuelve a crear el pool.")
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = self.crear_executor()
+            futuro = self.executor.submit(procesar_exportacion, ruta, tareas)
+        # Se marca recién cuando el trabajo quedó en el pool; el callback espera a que se suelte la condición
+        self.procesadas[ruta] = firma_actual
+        self.en_proceso.add(carpeta)
+        futuro.add_done_callback(lambda f: self.terminado(ruta, carpeta, f))
+
+    def terminado(self, ruta, carpeta, futuro):
+        with self.condicion:
+            self.en_proceso.discard(carpeta)
+            try:
+                for salida, cantidad in futuro.result():
+                    if cantidad:
+                        print(f"[{time.strftime('%H:%M:%S')}] ¡Éxito! {cantidad} Placemarks guardados en: "
+                              f"{os.path.join(carpeta, salida)}")
+                    else:
+                        print(f"No se encontraron elementos <Placemark> en '{ruta}' para '{salida}'.")
+            except BrokenProcessPool:
+                # El proceso que lo tenía terminó de golpe: se olvida la firma para reintentarlo cuando cambie
+                self.procesadas.pop(ruta, None)
+                print(f"Error al procesar '{ruta}': un proceso de trabajo terminó de forma inesperada.")
+            except Exception as e:
+                print(f"Error al procesar '{ruta}': {e}")
+            self.condicion.notify()
+
+    def crear_executor(self):
+        return ProcessPoolExecutor(max_workers=self.trabajadores, initializer=ignorar_interrupcion)
+
+    def ejecutar(self):
+        """Vigila las carpetas hasta que se interrumpe con Ctrl+C."""
+        self.executor = self.crear_executor()
+        if Observer is not None:
+            vigia = Observer()
+            for carpeta in self.carpetas:
+                vigia.schedule(ManejadorEventos(self), carpeta, recursive=False)
+            vigia.start()
+            print(f"Vigilando {len(self.carpetas)} carpetas (notificaciones del sistema).")
+        else:
+            vigia = threading.Thread(target=self.sondear, daemon=True)
+            vigia.start()
+            print(f"Vigilando {len(self.carpetas)} carpetas (revisión cada {self.intervalo_sondeo:g} s; "
+                  "instala watchdog para usar las notificaciones del sistema).")
+        self.pendientes_al_iniciar()
+
+        try:
+            with self.condicion:
+                while True:
+                    ahora = time.monotonic()
+                    for ruta in [r for r, (instante, _) in self.pendientes.items() if instante <= ahora]:
+                        try:
+                            self.revisar(ruta, ahora)
+                        except FileNotFoundError:
+                            # Se movió o se borró entre la revisión y la lectura: el destino llega como otro evento
+                            self.pendientes.pop(ruta, None)
+                        except OSError as e:
+                            # Ej. bloqueado por otro programa en Windows: se vuelve a intentar más tarde
+                            print(f"Advertencia: No se pudo revisar '{ruta}': {e}. Se reintentará.")
+                            self.procesadas.pop(ruta, None)
+                            self.pendientes[ruta] = (ahora + self.espera, None)
+                    # Sin pendientes solo se despierta una vez por segundo: en Windows Ctrl+C no interrumpe
+                    # una espera sin límite sobre un lock, y así el consumo de CPU en reposo sigue siendo casi nulo
+                    proximo = min((instante for instante, _ in self.pendientes.values()), default=ahora + ESPERA_MAXIMA)
+                    self.condicion.wait(min(max(proximo - ahora, 0), ESPERA_MAXIMA))
+        except KeyboardInterrupt:
+            print("\nVigilante detenido.")
+        finally:
+            self.detenido.set()
+            if Observer is not None:
+                vigia.stop()
+                vigia.join()
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+# --- Configuración ---
+# Carpetas vigiladas (relativas a 'Cambios de Capas'): patrones de las exportaciones que se descargan
+# en ella y tareas (regla de reglas_capas.py, ordenar, salida KML, salida GeoJSON o None).
+# Las salidas son las mismas que generan los scripts de cada carpeta.
+carpetas_config = {
+    'Pozos San Rafael': (
+        ['doc.kml', 'Pozos San Rafael*'],
+        [('pozos_san_rafael_con_depto', False, 'pozos_san_rafael_con_nombres.kml', 'pozos_san_rafael_con_nombres.geojsonl'),
+         ('pozos_san_rafael', True, 'pozos_san_rafael_ordenados.kml', 'pozos_san_rafael_ordenados.geojsonl')],
+    ),
+    'Pozos Medidos': (
+        ['doc.kml', 'Monitoreo Aguas Subterranea*'],
+        [('pozos_monitoreo', True, 'monitoreo_aguas_subterranea_ordenado_solo_por_nombre.kml',
+          'monitoreo_aguas_subterranea_ordenado_solo_por_nombre.geojsonl')],
+    ),
+    'Pozos Medidos Con Exito': (
+        ['doc.kml', 'Medidos Con Exito*'],
+        [('pozos_monitoreo', True, 'medidos_con_exito_2025_ordenados.kml', 'medidos_con_exito_2025_ordenados.geojsonl')],
+    ),
+    'Superficial': (
+        ['doc.kml', 'Padriones*'],
+        [('superficial', True, 'padriones_ordenados_doble_criterio.kml', 'padriones_ordenados_doble_criterio.geojsonl'),
+         ('superficial', True, 'padriones_ordenados_con_atributos.kml', 'padriones_ordenados_con_atributos.geojsonl')],
+    ),
+}
+# Capas que se pueden procesar a la vez
+trabajadores = 2
+# Segundos sin cambios antes de procesar un archivo (las descargas escriben en varias tandas)
+espera = 2.0
+# Segundos entre revisiones de las carpetas cuando watchdog no está instalado
+intervalo_sondeo = 5.0
+
+# --- Ejecutar la función ---
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    carpetas = {os.path.join(base_dir, carpeta): config for carpeta, config in carpetas_config.items()}
+    faltantes = [carpeta for carpeta in carpetas if not os.path.isdir(carpeta)]
+    if faltantes:
+        for carpeta in faltantes:
+            print(f"Error: La carpeta '{carpeta}' no existe.")
+        sys.exit(1)
+
+    VigilanteCarpetas(carpetas, trabajadores, espera, intervalo_sondeo).ejecutar()